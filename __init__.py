@@ -2,4 +2,6 @@
 
 from . import controllers
 from . import models
+from . import report
 from . import wizard
+
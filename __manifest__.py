@@ -21,12 +21,16 @@
         'security/security.xml',
         'security/ir.model.access.csv',
         'data/data.xml',
+        'data/ir_cron.xml',
+        'report/attendance_sheet_report.xml',
         'wizard/change_att_data_view.xml',
         'views/hr_attendance_sheet_view.xml',
         'views/att_sheet_batch_view.xml',
+        'report/attendance_sheet_summary_views.xml',
         'views/hr_attendance_policy_view.xml',
         'views/hr_public_holiday_view.xml',
         'views/hr_employee.xml',
+        'views/hr_work_site_view.xml',
         'views/views.xml',
     ],
     # only loaded in demonstration mode
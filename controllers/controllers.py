@@ -1,21 +1,177 @@
 # -*- coding: utf-8 -*-
-# from odoo import http
-
-
-# class HrGeotagging(http.Controller):
-#     @http.route('/hr_geotagging/hr_geotagging/', auth='public')
-#     def index(self, **kw):
-#         return "Hello, world"
-
-#     @http.route('/hr_geotagging/hr_geotagging/objects/', auth='public')
-#     def list(self, **kw):
-#         return http.request.render('hr_geotagging.listing', {
-#             'root': '/hr_geotagging/hr_geotagging',
-#             'objects': http.request.env['hr_geotagging.hr_geotagging'].search([]),
-#         })
-
-#     @http.route('/hr_geotagging/hr_geotagging/objects/<model("hr_geotagging.hr_geotagging"):obj>/', auth='public')
-#     def object(self, obj, **kw):
-#         return http.request.render('hr_geotagging.object', {
-#             'object': obj
-#         })
+
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date
+from werkzeug.exceptions import BadRequest
+import odoo
+from odoo import api, fields, http, _
+from odoo.http import content_disposition, request, Response
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class HrGeotagging(http.Controller):
+
+    @http.route('/hr_geotagging/attendance/check', type='json', auth='user')
+    def attendance_check(self, latitude, longitude, **kw):
+        """ Check the current user's employee in or out at the given point,
+        which must lie inside one of the work sites geofences. """
+        employee = request.env.user.employee_id
+        if not employee:
+            return {'error': _("No employee is linked to your user.")}
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+        except (TypeError, ValueError):
+            return {'error': _("Invalid coordinates.")}
+        site_id = request.env['hr.work.site'].locate(latitude, longitude, employee.company_id.id)
+        if not site_id:
+            return {'error': _("You are outside of the allowed work sites.")}
+        # write the punch alone and only queue its days, the sheets are
+        # maintained by the deferred recompute job
+        attendance_obj = request.env['hr.attendance'].sudo().with_context(att_sheet_no_recompute=True)
+        if employee.attendance_state != 'checked_in':
+            attendance = attendance_obj.create({
+                'employee_id': employee.id,
+                'check_in': fields.Datetime.now(),
+                'check_in_latitude': latitude,
+                'check_in_longitude': longitude,
+                'check_in_site_id': site_id,
+            })
+            action = 'check_in'
+        else:
+            attendance = attendance_obj.search([('employee_id', '=', employee.id),
+                                                ('check_out', '=', False)],
+                                               order='check_in desc', limit=1)
+            attendance.write({
+                'check_out': fields.Datetime.now(),
+                'check_out_latitude': latitude,
+                'check_out_longitude': longitude,
+                'check_out_site_id': site_id,
+            })
+            action = 'check_out'
+        request.env['attendance.sheet.pending.day'].sudo()._mark(attendance._get_sheet_days())
+        return {'action': action, 'attendance_id': attendance.id, 'site_id': site_id}
+
+    @http.route('/hr_geotagging/attendance/punches', type='http', auth='user', methods=['POST'], csrf=False)
+    def attendance_punches(self, **kw):
+        """ Ingest a batch of device punches sent as a JSON array or as NDJSON
+        (one punch per line) and answer one result per punch. """
+        data = request.httprequest.get_data(as_text=True).strip()
+        try:
+            if data.startswith('['):
+                items = json.loads(data)
+            else:
+                items = [json.loads(line) for line in data.splitlines() if line.strip()]
+        except ValueError:
+            return request.make_response(json.dumps({'error': _("Invalid punches payload.")}),
+                                         headers=[('Content-Type', 'application/json')], status=400)
+        results = request.env['hr.attendance'].ingest_punches(items)
+        return request.make_response(json.dumps({'results': results}),
+                                     headers=[('Content-Type', 'application/json')])
+
+    @http.route('/hr_geotagging/export/<string:model>/<string:ids>', type='http', auth='user')
+    def export_sheet_lines(self, model, ids, export_format='csv', **kw):
+        """ Stream the attendance sheet lines of batches or sheets as CSV or
+        XLSX. The rows are read by chunks on a dedicated cursor while the
+        response is sent, so memory does not grow with the number of lines.
+        """
+        Line = request.env['attendance.sheet.line']
+        sheet_ids = Line._get_export_sheet_ids(model, [int(res_id) for res_id in ids.split(',') if res_id])
+        header = Line._get_export_header()
+        rows = self._iter_export_rows(request.env.cr.dbname, request.env.uid,
+                                      dict(request.env.context), sheet_ids)
+        filename = 'attendance_sheet_lines.%s' % ('xlsx' if export_format == 'xlsx' else 'csv')
+        if export_format == 'xlsx':
+            if not xlsxwriter:
+                raise BadRequest(_("The xlsxwriter library is required for XLSX exports."))
+            body = self._stream_xlsx(header, rows)
+            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            body = self._stream_csv(header, rows)
+            content_type = 'text/csv;charset=utf8'
+        return Response(body, direct_passthrough=True, headers=[
+            ('Content-Type', content_type),
+            ('Content-Disposition', content_disposition(filename)),
+        ])
+
+    @http.route('/hr_geotagging/print/<int:batch_id>', type='http', auth='user')
+    def print_batch_sheets(self, batch_id, **kw):
+        """ Stream the attendance sheets of a batch as one PDF, merged in a
+        temporary file that is removed once sent. """
+        batch = request.env['attendance.sheet.batch'].browse(batch_id).exists()
+        if not batch:
+            raise BadRequest(_("The attendance sheet batch does not exist."))
+        batch.check_access_rights('read')
+        batch.check_access_rule('read')
+        output = tempfile.TemporaryFile()
+        try:
+            batch._write_sheets_pdf(output)
+        except Exception:
+            output.close()
+            raise
+        size = output.tell()
+        output.seek(0)
+        return Response(self._stream_file(output), direct_passthrough=True, headers=[
+            ('Content-Type', 'application/pdf'),
+            ('Content-Length', size),
+            ('Content-Disposition', content_disposition(batch._get_print_filename())),
+        ])
+
+    @staticmethod
+    def _stream_file(stream):
+        try:
+            for data in iter(lambda: stream.read(65536), b''):
+                yield data
+        finally:
+            stream.close()
+
+    @staticmethod
+    def _iter_export_rows(dbname, uid, context, sheet_ids):
+        with api.Environment.manage(), odoo.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            for row in env['attendance.sheet.line']._iter_export_rows(sheet_ids, EXPORT_CHUNK_SIZE):
+                yield row
+
+    @staticmethod
+    def _stream_csv(header, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        writer.writerow(header)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(['' if value is None else value for value in row])
+            if not count % EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    @staticmethod
+    def _stream_xlsx(header, rows):
+        # in constant memory mode, xlsxwriter flushes every row to a temporary
+        # file as soon as the next one is written
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+            worksheet = workbook.add_worksheet()
+            bold = workbook.add_format({'bold': True})
+            worksheet.write_row(0, 0, header, bold)
+            for row_index, row in enumerate(rows, 1):
+                worksheet.write_row(row_index, 0, [
+                    value.isoformat() if isinstance(value, date) else value for value in row])
+            workbook.close()
+            with open(path, 'rb') as xlsx_file:
+                for data in iter(lambda: xlsx_file.read(65536), b''):
+                    yield data
+        finally:
+            os.unlink(path)
@@ -5,4 +5,6 @@ from . import hr_attendance_sheet
 from . import att_sheet_batch
 from . import hr_holidays
 from . import resource
+from . import hr_attendance
+from . import hr_work_site
 from . import models
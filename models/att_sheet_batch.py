@@ -21,6 +21,12 @@ from odoo.exceptions import UserError, ValidationError
 import babel
 from operator import itemgetter
 import logging
+import tempfile
+from psycopg2.extensions import TransactionRollbackError
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from ..utils.np_engine import np
+
+_logger = logging.getLogger(__name__)
 
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 TIME_FORMAT = "%H:%M:%S"
@@ -31,7 +37,14 @@ class AttendanceSheetBatch(models.Model):
     _description = 'Attendance Sheet Batch'
 
     name = fields.Char("name")
-    department_id = fields.Many2one('hr.department', 'Department Name', required=True)
+    scope = fields.Selection([
+        ('department', 'Department'),
+        ('departments', 'Departments'),
+        ('company', 'Company')], default='department', required=True, string='Scope',
+        help='Batches covering several departments or a whole company are generated by department shards.')
+    department_id = fields.Many2one('hr.department', 'Department Name')
+    department_ids = fields.Many2many('hr.department', string='Departments')
+    company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
     date_from = fields.Date(string='Date From', readonly=True, required=True,
                             default=lambda self: fields.Date.to_string(date.today().replace(day=1)), )
     date_to = fields.Date(string='Date To', readonly=True, required=True,
@@ -46,43 +59,126 @@ class AttendanceSheetBatch(models.Model):
         ('att_sub', 'Attendance Sheets Submitted'),
         ('done', 'Close')], default='draft', track_visibility='onchange',
         string='Status', required=True, readonly=True, index=True, )
+    gen_mode = fields.Selection([
+        ('serial', 'Serial'),
+        ('parallel', 'Parallel')], default='serial', required=True,
+        string='Generation Mode',
+        help='Parallel mode queues chunks of employees, generated in the background by scheduled '
+             'actions running in several workers, each chunk in its own transaction.')
+    engine = fields.Selection([
+        ('python', 'Python'),
+        ('numpy', 'NumPy (vectorized)')], default='python', required=True,
+        string='Computation Engine',
+        help='The vectorized engine computes the lines of all the sheets at once and requires numpy.')
+    chunk_size = fields.Integer(string='Employees per Chunk', default=200)
+    chunk_ids = fields.One2many(comodel_name='attendance.sheet.batch.chunk', string='Generation Shards',
+                                inverse_name='batch_id', readonly=True)
+    rolling = fields.Boolean(string='Rolling Generation', readonly=True,
+                             help='The lines of the sheets are appended every night by a scheduled action.')
+    rolled_to = fields.Date(string='Generated Until', readonly=True)
+    run_ids = fields.One2many(comodel_name='attendance.sheet.batch.run', string='Runs',
+                              inverse_name='batch_id', readonly=True)
 
-    @api.onchange('department_id', 'date_from', 'date_to')
+    @api.onchange('scope', 'department_id', 'company_id', 'date_from', 'date_to')
     def onchange_employee(self):
-        if (not self.department_id) or (not self.date_from) or (not self.date_to):
+        if (not self.date_from) or (not self.date_to):
             return
-        department = self.department_id
         date_from = self.date_from
         ttyme = datetime.combine(fields.Date.from_string(date_from), time.min)
         locale = self.env.context.get('lang', 'en_US')
-        self.name = _('Attendance Batch of %s  Department for %s') % (
-            department.name,
-            tools.ustr(babel.dates.format_date(date=ttyme, format='MMMM-y', locale=locale)))
+        period = tools.ustr(babel.dates.format_date(date=ttyme, format='MMMM-y', locale=locale))
+        if self.scope == 'department':
+            if not self.department_id:
+                return
+            self.name = _('Attendance Batch of %s  Department for %s') % (self.department_id.name, period)
+        elif self.scope == 'company':
+            if not self.company_id:
+                return
+            self.name = _('Attendance Batch of %s for %s') % (self.company_id.name, period)
+        else:
+            self.name = _('Attendance Batch of Departments for %s') % period
 
-    def action_done(self):
+    @api.constrains('scope', 'department_id', 'department_ids', 'company_id')
+    def _check_scope(self):
         for batch in self:
-            if batch.state != "att_sub":
-                continue
-            for sheet in batch.att_sheet_ids:
-                if sheet.state == 'confirm':
-                    sheet.action_attsheet_approve()
-                    sheet.create_payslip_id()
-            batch.write({'state': 'done'})
+            if batch.scope == 'department' and not batch.department_id:
+                raise ValidationError(_("Please select the department of the batch."))
+            if batch.scope == 'departments' and not batch.department_ids:
+                raise ValidationError(_("Please select the departments of the batch."))
+            if batch.scope == 'company' and not batch.company_id:
+                raise ValidationError(_("Please select the company of the batch."))
+
+    def _get_payslip_run(self):
+        self.ensure_one()
+        if not self.payslip_batch_id:
+            self.payslip_batch_id = self.env['hr.payslip.run'].create({
+                'name': self.name,
+                'date_start': self.date_from,
+                'date_end': self.date_to,
+            })
+        return self.payslip_batch_id
+
+    def action_done(self):
+        batches = self.filtered(lambda batch: batch.state == "att_sub")
+        for batch in batches:
+            batch._get_payslip_run()
+            with self.env['attendance.sheet']._att_profile('action_done', batch) as profiler:
+                batch.with_context(att_profiler=profiler).mapped('att_sheet_ids').filtered(
+                    lambda sheet: sheet.state == 'confirm').action_attsheet_approve()
+        batches.write({'state': 'done'})
+
+    def _save_run(self, operation, summary):
+        """ Store the summary of an instrumented run of the batch. """
+        self.ensure_one()
+        self.env['attendance.sheet.batch.run'].sudo().create({
+            'batch_id': self.id,
+            'operation': operation,
+            'duration': summary['duration'],
+            'query_count': summary['queries'],
+            'row_count': summary['rows'],
+            'deleted_count': summary['deleted'],
+            'phase_ids': [(0, 0, {
+                'name': phase['name'],
+                'calls': phase['calls'],
+                'duration': phase['duration'],
+                'query_count': phase['queries'],
+                'row_count': phase['rows'],
+                'deleted_count': phase['deleted'],
+            }) for phase in summary['phases']],
+        })
 
     def action_att_gen(self):
         return self.write({'state': 'att_gen'})
 
-    def gen_att_sheet(self):
+    @api.constrains('engine')
+    def _check_engine(self):
+        if np is None and any(batch.engine == 'numpy' for batch in self):
+            raise ValidationError(_("The NumPy engine requires the numpy python library."))
 
-        att_sheets = self.env['attendance.sheet']
-        att_sheet_obj = self.env['attendance.sheet']
-        for batch in self:
-            from_date = batch.date_from
-            to_date = batch.date_to
-            employee_ids = self.env['hr.employee'].search([('department_id', '=', batch.department_id.id)])
+    def _get_batch_employees(self):
+        self.ensure_one()
+        if self.scope == 'department':
+            domain = [('department_id', '=', self.department_id.id)]
+        elif self.scope == 'departments':
+            domain = [('department_id', 'in', self.department_ids.ids)]
+        else:
+            domain = [('company_id', '=', self.company_id.id)]
+        with self.env['attendance.sheet']._att_phase('employees') as stat:
+            employee_ids = self.env['hr.employee'].search(domain)
+            stat.rows = len(employee_ids)
+        if not employee_ids:
+            raise UserError(_("There is no  Employees In This Department"))
+        return employee_ids
 
-            if not employee_ids:
-                raise UserError(_("There is no  Employees In This Department"))
+    def _create_att_sheets(self, employee_ids, compute=True):
+        """ Create the attendance sheets of ``employee_ids`` for the batch
+        period and compute their lines, unless ``compute`` is False. """
+        self.ensure_one()
+        att_sheet_obj = self.env['attendance.sheet']
+        vals_list = []
+        from_date = self.date_from
+        to_date = self.date_to
+        with att_sheet_obj._att_phase('sheets') as stat:
             for employee in employee_ids:
                 contract_ids = employee._get_contracts(from_date, to_date)
                 if not contract_ids:
@@ -91,22 +187,342 @@ class AttendanceSheetBatch(models.Model):
                     'employee_id': employee.id,
                     'date_from': from_date,
                     'date_to': to_date,
-                    'batch_id': batch.id
+                    'batch_id': self.id
                 })
                 new_sheet.onchange_employee()
-                values = att_sheet_obj._convert_to_write(new_sheet._cache)
-                att_sheet_id = att_sheet_obj.create(values)
+                vals_list.append(att_sheet_obj._convert_to_write(new_sheet._cache))
+            # one create, so that the overlap constraint checks all the sheets at once
+            att_sheets = att_sheet_obj.create(vals_list)
+            stat.rows = len(att_sheets)
+        if compute:
+            att_sheets.get_attendances()
+        return att_sheets
+
+    def gen_att_sheet(self):
+        for batch in self:
+            # sharded batches are only queued here, the sheets are generated
+            # by the chunk runs recorded on their own
+            queue = not batch.rolling and (batch.gen_mode == 'parallel' or batch.scope != 'department')
+            operation = 'queue_att_sheet_chunks' if queue else 'gen_att_sheet'
+            with self.env['attendance.sheet']._att_profile(operation, batch) as profiler:
+                batch = batch.with_context(att_profiler=profiler)
+                if batch.rolling:
+                    batch._roll_att_sheets(batch.date_to)
+                    continue
+                if queue:
+                    batch._gen_att_sheet_chunks()
+                    continue
+                batch._create_att_sheets(batch._get_batch_employees())
+                batch.action_att_gen()
+
+    def _roll_att_sheets(self, day):
+        """ Append the lines of the days following the last generated one
+        up to ``day`` to the sheets of the batch, creating the sheets of the
+        employees who have none yet. The batch is marked as generated once
+        its last day is reached.
+        """
+        self.ensure_one()
+        att_sheet_obj = self.env['attendance.sheet']
+        date_from = self.rolled_to + timedelta(days=1) if self.rolled_to else self.date_from
+        date_to = min(day, self.date_to)
+        if date_from > date_to or self.state != 'draft':
+            return
+        employees = self._get_batch_employees()
+        employees = employees.filtered(lambda emp: emp._get_contracts(self.date_from, self.date_to))
+        covered = att_sheet_obj.search([('employee_id', 'in', employees.ids),
+                                        ('date_from', '<=', self.date_to),
+                                        ('date_to', '>=', self.date_from)]).mapped('employee_id')
+        sheets = self.att_sheet_ids.filtered(lambda sheet: sheet.state == 'draft')
+        new_sheets = self._create_att_sheets(employees - covered, compute=False)
+        sheets._append_attendance_days(date_from, date_to)
+        # the sheets of new employees catch up from the start of the period
+        new_sheets._append_attendance_days(self.date_from, date_to)
+        self.rolled_to = date_to
+        if date_to >= self.date_to:
+            self.action_att_gen()
+
+    @api.model
+    def _cron_roll_att_sheets(self):
+        """ Keep a rolling batch open for the current month of every
+        department set up for rolling sheets and append the lines of the
+        days up to the previous one to the sheets of the open rolling
+        batches, the batches of the previous months included, so that the
+        nights the scheduled action missed are caught up. """
+        day = fields.Date.context_today(self) - timedelta(days=1)
+        date_from = day.replace(day=1)
+        date_to = date_from + relativedelta(months=1, days=-1)
+        departments = self.env['hr.department'].search([('att_rolling', '=', True),
+                                                        ('att_policy_id', '!=', False)])
+        batches = self.search([('rolling', '=', True),
+                               ('state', '=', 'draft'),
+                               ('date_from', '<=', day)], order='date_from, id')
+        # a department already having a batch for the month, whatever its
+        # scope, is left to it
+        month_batches = self.search(['&', '&', ('date_from', '<=', date_to), ('date_to', '>=', date_from),
+                                     '|', '|', ('department_id', 'in', departments.ids),
+                                     ('department_ids', 'in', departments.ids),
+                                     '&', ('scope', '=', 'company'),
+                                     ('company_id', 'in', departments.mapped('company_id').ids)])
+        covered = month_batches.filtered(lambda batch: batch.scope == 'department').mapped('department_id')
+        covered |= month_batches.filtered(lambda batch: batch.scope == 'departments').mapped('department_ids')
+        companies = month_batches.filtered(lambda batch: batch.scope == 'company').mapped('company_id')
+        covered |= departments.filtered(lambda dep: dep.company_id in companies)
+        vals_list = []
+        for department in departments - covered:
+            new_batch = self.new({'department_id': department.id, 'date_from': date_from, 'date_to': date_to})
+            new_batch.onchange_employee()
+            vals = self._convert_to_write(new_batch._cache)
+            vals['rolling'] = True
+            vals_list.append(vals)
+        batches |= self.create(vals_list)
+        for batch in batches:
+            try:
+                with self.env.cr.savepoint(), \
+                        self.env['attendance.sheet']._att_profile('roll_att_sheets', batch) as profiler:
+                    batch.with_context(att_profiler=profiler)._roll_att_sheets(day)
+            except Exception:
+                # one failing batch must not stop the others from rolling
+                self.env.cache.invalidate()
+                _logger.exception("Rolling generation of attendance batch %s failed", batch.id)
+
+    def _get_gen_workers(self):
+        """ Return the number of scheduled action runners sharing the queue
+        of chunks, by default the number of cron threads of the server. """
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'hr_geotagging.gen_workers', 0))
+        return max(workers or tools.config.get('max_cron_threads') or 1, 1)
+
+    def _prepare_chunks(self, employees, sequence=0):
+        """ Return the values of the shards of ``employees``: the employees
+        of every department, split by chunks of ``chunk_size`` employees.
+        The employees without a department share shards of their own. """
+        self.ensure_one()
+        employees_by_department = {}
+        for employee in employees.sorted('id'):
+            employees_by_department.setdefault(employee.department_id, []).append(employee.id)
+        chunk_size = max(self.chunk_size, 1)
+        vals_list = []
+        for department, employee_ids in sorted(employees_by_department.items(), key=lambda item: item[0].id or 0):
+            for i in range(0, len(employee_ids), chunk_size):
+                vals_list.append({
+                    'sequence': sequence + len(vals_list),
+                    'department_id': department.id,
+                    'employee_ids': [(6, 0, employee_ids[i:i + chunk_size])],
+                })
+        return vals_list
+
+    def _gen_att_sheet_chunks(self):
+        """ Queue the shards of employees of one department of the batch
+        and wake up the scheduled actions generating them in the background,
+        each shard in its own transaction. Shards already done are kept, so
+        generating again only queues the pending and failed ones, plus new
+        shards for the employees in no shard and without a sheet yet.
+        """
+        self.ensure_one()
+        employees = self._get_batch_employees() - self.chunk_ids.mapped('employee_ids') \
+            - self.att_sheet_ids.mapped('employee_id')
+        if employees:
+            sequence = max(self.chunk_ids.mapped('sequence') or [-1]) + 1
+            self.write({'chunk_ids': [(0, 0, vals) for vals in self._prepare_chunks(employees, sequence)]})
+        chunks = self.chunk_ids.filtered(lambda chunk: chunk.state != 'done')
+        chunks.write({'state': 'pending', 'message': False})
+        if chunks:
+            self._trigger_gen_crons()
+        else:
+            self.action_att_gen()
 
-                att_sheet_id.get_attendances()
-                att_sheets += att_sheet_id
-            batch.action_att_gen()
+    @api.model
+    def _get_gen_crons(self):
+        """ Return the scheduled actions generating the queued chunks, one
+        per worker, creating the missing ones as copies of the first. """
+        cron = self.env.ref('hr_geotagging.ir_cron_gen_att_sheet_chunks').sudo()
+        crons = cron.with_context(active_test=False).search([('model_id', '=', cron.model_id.id),
+                                                            ('code', '=', cron.code)], order='id')
+        for i in range(len(crons), self._get_gen_workers()):
+            crons |= cron.copy({'name': '%s (%s)' % (cron.name, i + 1)})
+        return crons
+
+    @api.model
+    def _trigger_gen_crons(self):
+        crons = self._get_gen_crons()
+        # the runners being executed hold the lock of their row and process
+        # the queue until it is empty
+        self.env.cr.execute("""
+            UPDATE ir_cron
+               SET nextcall = (now() at time zone 'UTC'), active = true
+             WHERE id IN (SELECT id FROM ir_cron WHERE id IN %s FOR UPDATE SKIP LOCKED)
+        """, (tuple(crons.ids),))
+        crons.invalidate_cache(['nextcall', 'active'])
+
+    @api.model
+    def _cron_gen_att_sheet_chunks(self):
+        """ Generate the queued chunks one by one, committing after each of
+        them. Several runners share the queue: a runner claims a chunk with a
+        row lock that the others skip.
+        """
+        chunk_obj = self.env['attendance.sheet.batch.chunk']
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM attendance_sheet_batch_chunk
+                 WHERE state = 'pending'
+              ORDER BY batch_id, sequence, id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                break
+            chunk = chunk_obj.browse(row[0])
+            chunk._generate()
+            self.env.cr.commit()
+            self.env.cache.invalidate()
+            chunk.batch_id._check_chunks_done()
+            self.env.cr.commit()
+        # batches whose last check was skipped on a concurrent update
+        for batch in self.search([('state', '=', 'draft'), ('chunk_ids', '!=', False)]):
+            if all(chunk.state == 'done' for chunk in batch.chunk_ids):
+                batch._check_chunks_done()
+                self.env.cr.commit()
+
+    def _check_chunks_done(self):
+        """ Mark the batch as generated once all its chunks are done. The
+        runners finishing chunks of the same batch wait for each other on
+        the lock of the batch row, so the last one checks the chunks once the
+        others are committed.
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute("SELECT id FROM attendance_sheet_batch WHERE id = %s FOR UPDATE",
+                                    (self.id,))
+        except TransactionRollbackError:
+            # the batch was updated by a runner committed meanwhile; the
+            # runner sweep checks it again
+            return
+        if self.state == 'draft' and all(chunk.state == 'done' for chunk in self.chunk_ids):
+            self.action_att_gen()
 
     def submit_att_sheet(self):
-        for batch in self:
-            if batch.state != "att_gen":
-                continue
-            for sheet in batch.att_sheet_ids:
-                if sheet.state == 'draft':
-                    sheet.action_confirm()
+        batches = self.filtered(lambda batch: batch.state == "att_gen")
+        batches.mapped('att_sheet_ids').filtered(
+            lambda sheet: sheet.state == 'draft').action_attsheet_confirm()
+        batches.write({'state': 'att_sub'})
+
+    def _get_report_chunk_size(self):
+        chunk_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'hr_geotagging.report_chunk_size', 0))
+        return chunk_size or 50
+
+    def action_print_sheets(self):
+        self.ensure_one()
+        if not self.att_sheet_ids:
+            raise UserError(_("There is no attendance sheet to print in this batch."))
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/hr_geotagging/print/%s' % self.id,
+            'target': 'self',
+        }
+
+    def _get_print_filename(self):
+        return _('Attendance Sheets - %s.pdf') % (self.name or self.department_id.name or '')
+
+    def _write_sheets_pdf(self, output):
+        """ Write the attendance sheets of the batch as one PDF to the binary
+        file ``output``. The sheets are rendered by chunks so that no
+        wkhtmltopdf call gets the whole batch, and the rendered chunks are
+        kept in temporary files while their pages are merged.
+        """
+        self.ensure_one()
+        sheets = self.att_sheet_ids.sorted(lambda sheet: sheet.employee_id.name or '')
+        if not sheets:
+            raise UserError(_("There is no attendance sheet to print in this batch."))
+        report = self.env.ref('hr_geotagging.action_report_attendance_sheet')
+        chunk_size = self._get_report_chunk_size()
+        writer = PdfFileWriter()
+        streams = []
+        try:
+            for i in range(0, len(sheets), chunk_size):
+                pdf_content, _format = report.render_qweb_pdf(sheets[i:i + chunk_size].ids)
+                stream = tempfile.TemporaryFile()
+                stream.write(pdf_content)
+                stream.seek(0)
+                streams.append(stream)
+                writer.appendPagesFromReader(PdfFileReader(stream, strict=False))
+                # the rendered records are not needed anymore
+                self.env['attendance.sheet'].invalidate_cache()
+                self.env['attendance.sheet.line'].invalidate_cache()
+            writer.write(output)
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def action_export_lines(self):
+        return self.env['attendance.sheet.line']._get_export_action(self._name, self.ids)
+
+
+class AttendanceSheetBatchChunk(models.Model):
+    _name = 'attendance.sheet.batch.chunk'
+    _description = 'Attendance Sheet Batch Chunk'
+    _order = 'batch_id, sequence'
+
+    batch_id = fields.Many2one(comodel_name='attendance.sheet.batch', string='Attendance Sheet Batch',
+                               required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(string='Sequence')
+    department_id = fields.Many2one(comodel_name='hr.department', string='Department', readonly=True)
+    employee_ids = fields.Many2many(comodel_name='hr.employee', string='Employees')
+    employee_count = fields.Integer(compute='_compute_employee_count', string='Employees Count')
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed')], default='pending', string='Status', required=True, readonly=True)
+    message = fields.Text(string='Message', readonly=True)
+
+    @api.depends('employee_ids')
+    def _compute_employee_count(self):
+        for chunk in self:
+            chunk.employee_count = len(chunk.employee_ids)
+
+    def _generate(self):
+        """ Generate the sheets of the employees of the chunk, recording
+        the error of the chunk instead of raising it. """
+        self.ensure_one()
+        batch = self.batch_id
+        try:
+            with self.env.cr.savepoint(), \
+                    self.env['attendance.sheet']._att_profile('gen_att_sheet_chunk', batch) as profiler:
+                batch.with_context(att_profiler=profiler)._create_att_sheets(self.employee_ids)
+            self.state = 'done'
+        except Exception as e:
+            self.env.cache.invalidate()
+            _logger.exception("Attendance sheet chunk %s failed", self.id)
+            self.write({'state': 'failed', 'message': tools.ustr(e)})
+
+
+class AttendanceSheetBatchRun(models.Model):
+    _name = 'attendance.sheet.batch.run'
+    _description = 'Attendance Sheet Batch Run'
+    _order = 'create_date desc, id desc'
+
+    batch_id = fields.Many2one(comodel_name='attendance.sheet.batch', string='Attendance Sheet Batch',
+                               required=True, ondelete='cascade', index=True)
+    operation = fields.Char(string='Operation', readonly=True)
+    duration = fields.Float(string='Duration (s)', readonly=True)
+    query_count = fields.Integer(string='Queries', readonly=True)
+    row_count = fields.Integer(string='Rows Written', readonly=True)
+    deleted_count = fields.Integer(string='Rows Deleted', readonly=True)
+    phase_ids = fields.One2many(comodel_name='attendance.sheet.batch.run.phase', string='Phases',
+                                inverse_name='run_id', readonly=True)
+
+
+class AttendanceSheetBatchRunPhase(models.Model):
+    _name = 'attendance.sheet.batch.run.phase'
+    _description = 'Attendance Sheet Batch Run Phase'
 
-            batch.write({'state': 'att_sub'})
+    run_id = fields.Many2one(comodel_name='attendance.sheet.batch.run', string='Run',
+                             required=True, ondelete='cascade', index=True)
+    name = fields.Char(string='Phase', readonly=True)
+    calls = fields.Integer(string='Calls', readonly=True)
+    duration = fields.Float(string='Duration (s)', readonly=True)
+    query_count = fields.Integer(string='Queries', readonly=True)
+    row_count = fields.Integer(string='Rows Written', readonly=True)
+    deleted_count = fields.Integer(string='Rows Deleted', readonly=True)
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+import logging
+import pytz
+import psycopg2
+from datetime import datetime
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+
+_logger = logging.getLogger(__name__)
+
+
+class HrAttendance(models.Model):
+    _inherit = 'hr.attendance'
+
+    check_in_latitude = fields.Float(string='Check In Latitude', digits=(10, 7), readonly=True)
+    check_in_longitude = fields.Float(string='Check In Longitude', digits=(10, 7), readonly=True)
+    check_in_site_id = fields.Many2one('hr.work.site', string='Check In Site', readonly=True)
+    check_out_latitude = fields.Float(string='Check Out Latitude', digits=(10, 7), readonly=True)
+    check_out_longitude = fields.Float(string='Check Out Longitude', digits=(10, 7), readonly=True)
+    check_out_site_id = fields.Many2one('hr.work.site', string='Check Out Site', readonly=True)
+    check_in_key = fields.Char(string='Check In Key', readonly=True, copy=False, index=True,
+                               help='Idempotency key of the device punch that checked in')
+    check_out_key = fields.Char(string='Check Out Key', readonly=True, copy=False, index=True,
+                                help='Idempotency key of the device punch that checked out')
+
+    _sql_constraints = [
+        ('check_in_key_uniq', 'unique(check_in_key)', 'The check in punch was already recorded.'),
+        ('check_out_key_uniq', 'unique(check_out_key)', 'The check out punch was already recorded.'),
+    ]
+
+    def _get_sheet_days(self):
+        """ Return {employee_id: set of local dates} of the punches, the days
+        of the attendance sheets they belong to.
+        """
+        sheet_obj = self.env['attendance.sheet']
+        tzs = {}
+        res = {}
+        for att in self:
+            if not att.check_in:
+                continue
+            employee = att.employee_id
+            if employee not in tzs:
+                tzs[employee] = sheet_obj._get_employee_tz(employee)
+            day = pytz.utc.localize(att.check_in).astimezone(tzs[employee]).date()
+            res.setdefault(att.employee_id.id, set()).add(day)
+        return res
+
+    def _recompute_sheet_days(self, employee_days):
+        """ Queue the days of the sheets to recompute; the punch transaction
+        only records them and the scheduled action updates the sheets. """
+        if self.env.context.get('att_sheet_no_recompute'):
+            return
+        self.env['attendance.sheet.pending.day'].sudo()._mark(employee_days)
+
+    @staticmethod
+    def _merge_sheet_days(*employee_days_list):
+        res = {}
+        for employee_days in employee_days_list:
+            for emp_id, days in employee_days.items():
+                res.setdefault(emp_id, set()).update(days)
+        return res
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attendances = super(HrAttendance, self).create(vals_list)
+        attendances._recompute_sheet_days(attendances._get_sheet_days())
+        return attendances
+
+    def write(self, vals):
+        if not {'employee_id', 'check_in', 'check_out'} & set(vals):
+            return super(HrAttendance, self).write(vals)
+        before = self._get_sheet_days()
+        res = super(HrAttendance, self).write(vals)
+        self._recompute_sheet_days(self._merge_sheet_days(before, self._get_sheet_days()))
+        return res
+
+    def unlink(self):
+        before = self._get_sheet_days()
+        res = super(HrAttendance, self).unlink()
+        self._recompute_sheet_days(before)
+        return res
+
+    @api.model
+    def _parse_punch(self, item, barcodes):
+        """ Return (key, employee_id, timestamp, type) of a device punch. """
+        key = item.get('key')
+        if not key:
+            raise ValueError(_("The punch has no idempotency key."))
+        employee_id = item.get('employee_id') or barcodes.get(item.get('barcode'))
+        if not employee_id:
+            raise ValueError(_("Unknown employee."))
+        timestamp = item.get('timestamp')
+        if isinstance(timestamp, (int, float)):
+            timestamp = datetime.utcfromtimestamp(timestamp)
+        else:
+            timestamp = fields.Datetime.to_datetime(timestamp)
+        if not timestamp:
+            raise ValueError(_("The punch has no timestamp."))
+        punch_type = item.get('type')
+        if punch_type not in (None, 'check_in', 'check_out'):
+            raise ValueError(_("Invalid punch type %s.") % punch_type)
+        return str(key), int(employee_id), timestamp, punch_type
+
+    @api.model
+    def ingest_punches(self, items):
+        """ Record a batch of device punches.
+
+        Every punch is a dict with an idempotency ``key``, an ``employee_id``
+        or ``barcode``, a UTC ``timestamp`` (string or epoch) and an optional
+        ``type`` (check_in/check_out, toggled when missing). Punches already
+        recorded are reported as duplicates, the others are paired per
+        employee in chronological order and inserted with one multi-create.
+
+        :return: one result dict per punch, in the order of ``items``
+        """
+        results = [{'key': item.get('key') if isinstance(item, dict) else None} for item in items]
+        barcodes = [item.get('barcode') for item in items
+                    if isinstance(item, dict) and item.get('barcode') and not item.get('employee_id')]
+        barcode_map = {}
+        if barcodes:
+            employees = self.env['hr.employee'].search_read([('barcode', 'in', barcodes)], ['barcode'])
+            barcode_map = {emp['barcode']: emp['id'] for emp in employees}
+
+        punches = []
+        seen = set()
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError(_("Invalid punch."))
+                punch = self._parse_punch(item, barcode_map)
+            except (ValueError, TypeError) as e:
+                results[index].update(status='error', message=str(e))
+                continue
+            if punch[0] in seen:
+                results[index].update(status='duplicate')
+                continue
+            seen.add(punch[0])
+            punches.append((index,) + punch)
+        if not punches:
+            return results
+
+        keys = [punch[1] for punch in punches]
+        self.flush(['check_in_key', 'check_out_key'])
+        self.env.cr.execute("""
+            SELECT id, check_in_key, check_out_key FROM hr_attendance
+            WHERE check_in_key = ANY(%s) OR check_out_key = ANY(%s)""", (keys, keys))
+        existing = {}
+        for att_id, in_key, out_key in self.env.cr.fetchall():
+            existing[in_key] = existing[out_key] = att_id
+        employee_punches = {}
+        for punch in punches:
+            if punch[1] in existing:
+                results[punch[0]].update(status='duplicate', attendance_id=existing[punch[1]])
+                continue
+            employee_punches.setdefault(punch[2], []).append(punch)
+        if not employee_punches:
+            return results
+
+        open_attendances = self.search([('employee_id', 'in', list(employee_punches)),
+                                        ('check_out', '=', False)])
+        open_map = {att.employee_id.id: att for att in open_attendances}
+        groups = []
+        for emp_id, emp_punches in employee_punches.items():
+            group = {'creates': [], 'writes': [], 'indexes': []}
+            current = open_map.get(emp_id)
+            current_vals = None
+            for index, key, _emp_id, timestamp, punch_type in sorted(emp_punches, key=lambda p: p[3]):
+                is_open = bool(current or current_vals)
+                if (punch_type or ('check_out' if is_open else 'check_in')) == 'check_in':
+                    if is_open:
+                        results[index].update(status='error', message=_("The employee is already checked in."))
+                        continue
+                    current_vals = {'employee_id': emp_id, 'check_in': timestamp, 'check_in_key': key}
+                    group['creates'].append(current_vals)
+                    group['indexes'].append((index, 'created', len(group['creates']) - 1))
+                elif not is_open:
+                    results[index].update(status='error', message=_("The employee is not checked in."))
+                elif current_vals:
+                    current_vals.update(check_out=timestamp, check_out_key=key)
+                    group['indexes'].append((index, 'closed', len(group['creates']) - 1))
+                    current_vals = None
+                else:
+                    group['writes'].append((current, {'check_out': timestamp, 'check_out_key': key}))
+                    group['indexes'].append((index, 'closed', current))
+                    current = None
+            if group['indexes']:
+                groups.append(group)
+
+        Attendance = self.with_context(att_sheet_no_recompute=True)
+        try:
+            with self.env.cr.savepoint():
+                attendances = self._ingest_groups(Attendance, groups)
+        except (UserError, ValidationError, psycopg2.IntegrityError):
+            # one employee breaks the batch: record the others on their own
+            self.env.cache.invalidate()
+            attendances = self.browse()
+            for group in groups:
+                try:
+                    with self.env.cr.savepoint():
+                        attendances |= self._ingest_groups(Attendance, [group])
+                except (UserError, ValidationError, psycopg2.IntegrityError) as e:
+                    self.env.cache.invalidate()
+                    message = e.name if isinstance(e, (UserError, ValidationError)) else str(e)
+                    for index, _status, _target in group['indexes']:
+                        results[index].update(status='error', message=message)
+                    group['failed'] = True
+        for group in groups:
+            if group.get('failed'):
+                continue
+            for index, status, target in group['indexes']:
+                if isinstance(target, int):
+                    target = group['created'][target]
+                results[index].update(status=status, attendance_id=target.id)
+        attendances._recompute_sheet_days(attendances._get_sheet_days())
+        return results
+
+    @api.model
+    def _ingest_groups(self, Attendance, groups):
+        attendances = Attendance.create([vals for group in groups for vals in group['creates']])
+        offset = 0
+        for group in groups:
+            group['created'] = attendances[offset:offset + len(group['creates'])]
+            offset += len(group['creates'])
+        for group in groups:
+            for attendance, vals in group['writes']:
+                attendance.with_context(att_sheet_no_recompute=True).write(vals)
+                attendances |= attendance
+        attendances.flush()
+        return attendances.with_context(att_sheet_no_recompute=False)
+
+
+class AttendanceSheetPendingDay(models.Model):
+    _name = 'attendance.sheet.pending.day'
+    _description = 'Attendance Sheet Day to Recompute'
+    _log_access = False
+
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True, ondelete='cascade')
+    date = fields.Date(string='Date', required=True)
+
+    _sql_constraints = [
+        ('employee_date_uniq', 'unique(employee_id, date)', 'The day is already queued.'),
+    ]
+
+    @api.model
+    def _mark(self, employee_days):
+        """ Queue the days of ``employee_days``, {employee_id: set of dates}.
+        Concurrent punches of an employee may queue the same day, hence the
+        insert ignoring the days already queued.
+        """
+        pairs = [(emp_id, day) for emp_id, days in employee_days.items() for day in days]
+        if not pairs:
+            return
+        self.env.cr.execute("""
+            INSERT INTO attendance_sheet_pending_day (employee_id, date)
+            SELECT unnest(%s), unnest(%s)
+                ON CONFLICT (employee_id, date) DO NOTHING
+        """, ([pair[0] for pair in pairs], [pair[1] for pair in pairs]))
+
+    @api.model
+    def _cron_recompute_days(self, limit=1000):
+        """ Recompute the sheet days queued by the punches, by batches of
+        ``limit`` days each committed on its own. The days of a batch are
+        claimed by deleting them, so several runs never process them twice.
+        """
+        sheet_obj = self.env['attendance.sheet'].sudo()
+        while True:
+            self.env.cr.execute("""
+                DELETE FROM attendance_sheet_pending_day
+                 WHERE id IN (SELECT id FROM attendance_sheet_pending_day
+                               ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED)
+             RETURNING employee_id, date
+            """, (limit,))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            employee_days = {}
+            for emp_id, day in rows:
+                employee_days.setdefault(emp_id, set()).add(day)
+            try:
+                with self.env.cr.savepoint():
+                    sheet_obj._recompute_attendance_days(employee_days)
+            except Exception:
+                self.env.cache.invalidate()
+                _logger.exception("Recomputing attendance sheet days failed")
+            self.env.cr.commit()
@@ -15,6 +15,43 @@ from odoo import models, fields, api, tools, _
 import babel
 import time
 from datetime import datetime, timedelta
+from ..utils.policy import PolicyEvaluator
+
+
+class HrAttendancePolicyRuleMixin(models.AbstractModel):
+    _name = 'hr.attendance.policy.rule.mixin'
+    _description = 'Attendance Policy Rule Mixin'
+
+    def _get_policy_domain(self):
+        """ Return the domain of the policies using the rules. """
+        return [('id', '=', False)]
+
+    def _touch_policies(self, policies=None):
+        """ Bump the write date of the policies using the rules, which keys
+        their cached evaluator. """
+        if policies is None:
+            policies = self.env['hr.attendance.policy'].search(self._get_policy_domain())
+        if policies:
+            policies.write({})
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(HrAttendancePolicyRuleMixin, self).create(vals_list)
+        records._touch_policies()
+        return records
+
+    def write(self, vals):
+        # the policies of the rules before and after the write
+        policies = self.env['hr.attendance.policy'].search(self._get_policy_domain())
+        res = super(HrAttendancePolicyRuleMixin, self).write(vals)
+        self._touch_policies(policies | self.env['hr.attendance.policy'].search(self._get_policy_domain()))
+        return res
+
+    def unlink(self):
+        policies = self.env['hr.attendance.policy'].search(self._get_policy_domain())
+        res = super(HrAttendancePolicyRuleMixin, self).unlink()
+        self._touch_policies(policies.exists())
+        return res
 
 
 class HrAttendancePolicy(models.Model):
@@ -34,107 +71,49 @@ class HrAttendancePolicy(models.Model):
     diff_rule_id = fields.Many2one(comodel_name="hr.diff.rule",
                                    string="Difference Time Rule", required=True)
 
+    @tools.ormcache('self.id', 'self.write_date')
+    def _get_evaluator(self):
+        """ Compile the policy and its rules into a PolicyEvaluator. """
+        self.ensure_one()
+        overtime = {}
+        for rule in self.overtime_rule_ids.sorted('id'):
+            prefix = {'workday': 'wd', 'weekend': 'we', 'ph': 'ph'}.get(rule.type)
+            if prefix and prefix + '_rate' not in overtime:
+                overtime[prefix + '_rate'] = rule.rate
+                overtime[prefix + '_after'] = rule.active_after
+        late_lines = diff_lines = absence_lines = None
+        if self.late_rule_id:
+            late_lines = [(line.time, line.type, line.rate, line.amount)
+                          for line in self.late_rule_id.line_ids]
+        if self.diff_rule_id:
+            diff_lines = [(line.time, line.type, line.rate, line.amount)
+                          for line in self.diff_rule_id.line_ids]
+        if self.absence_rule_id:
+            absence_lines = [(int(line.counter), line.rate)
+                             for line in self.absence_rule_id.line_ids]
+        return PolicyEvaluator(overtime, late_lines, diff_lines, absence_lines)
+
     def get_overtime(self):
         self.ensure_one()
-        res = {}
-        if self:
-            overtime_ids = self.overtime_rule_ids
-            wd_ot_id = self.overtime_rule_ids.search(
-                [('type', '=', 'workday'), ('id', 'in', overtime_ids.ids)],
-                order='id', limit=1)
-            we_ot_id = self.overtime_rule_ids.search(
-                [('type', '=', 'weekend'), ('id', 'in', overtime_ids.ids)],
-                order='id', limit=1)
-            ph_ot_id = self.overtime_rule_ids.search(
-                [('type', '=', 'ph'), ('id', 'in', overtime_ids.ids)],
-                order='id', limit=1)
-            if wd_ot_id:
-                res['wd_rate'] = wd_ot_id.rate
-                res['wd_after'] = wd_ot_id.active_after
-            else:
-                res['wd_rate'] = 1
-                res['wd_after'] = 0
-            if we_ot_id:
-                res['we_rate'] = we_ot_id.rate
-                res['we_after'] = we_ot_id.active_after
-            else:
-                res['we_rate'] = 1
-                res['we_after'] = 0
-
-            if ph_ot_id:
-                res['ph_rate'] = ph_ot_id.rate
-                res['ph_after'] = ph_ot_id.active_after
-            else:
-                res['ph_rate'] = 1
-                res['ph_after'] = 0
-        else:
-            res['wd_rate'] = res['wd_rate'] = res['ph_rate'] = 1
-            res['wd_after'] = res['we_after'] = res['ph_after'] = 0
-        return res
+        return self._get_evaluator().get_overtime()
 
     def get_late(self, period):
         self.ensure_one()
-        res = period
-        flag = False
-        if self:
-            if self.late_rule_id:
-                time_ids = self.late_rule_id.line_ids.sorted(
-                    key=lambda r: r.time, reverse=True)
-                for line in time_ids:
-                    if period >= line.time:
-                        flag = True
-                        if line.type == 'rate':
-                            res = line.rate * period
-                        elif line.type == 'fix':
-                            res = line.amount
-
-                        break
-
-                if not flag:
-                    res = 0
-        return res
+        return self._get_evaluator().get_late(period)
 
     def get_diff(self, period):
         self.ensure_one()
-        res = period
-        flag = False
-        if self:
-            if self.diff_rule_id:
-                time_ids = self.diff_rule_id.line_ids.sorted(
-                    key=lambda r: r.time, reverse=True)
-                for line in time_ids:
-                    if period >= line.time:
-                        flag = True
-                        if line.type == 'rate':
-                            res = line.rate * period
-                        elif line.type == 'fix':
-                            res = line.amount
-
-                        break
-
-                if not flag:
-                    res = 0
-        return res
+        return self._get_evaluator().get_diff(period)
 
     def get_absence(self, period, cnt):
-        res = period
-        flag = False
-        if self:
-            if self.absence_rule_id:
-                abs_ids = self.absence_rule_id.line_ids.sorted(
-                    key=lambda r: r.counter, reverse=True)
-                for ln in abs_ids:
-                    if cnt >= int(ln.counter):
-                        res = ln.rate * period
-                        flag = True
-                        break
-                if not flag:
-                    res = 0
-        return res
+        if not self:
+            return period
+        return self._get_evaluator().get_absence(period, cnt)
 
 
 class HrPolicyOvertimeLine(models.Model):
     _name = 'hr.policy.overtime.line'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Overtime Policy Lines'
 
     type = [
@@ -156,9 +135,13 @@ class HrPolicyOvertimeLine(models.Model):
             line.active_after = line.overtime_rule_id.active_after
             line.rate = line.overtime_rule_id.rate
 
+    def _get_policy_domain(self):
+        return [('id', 'in', self.mapped('attendance_policy_id').ids)]
+
 
 class HrOvertimeRule(models.Model):
     _name = 'hr.overtime.rule'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Over time Rules'
 
     type = [
@@ -172,17 +155,25 @@ class HrOvertimeRule(models.Model):
     active_after = fields.Float(string="Apply after", help="After this time the overtime will be calculated")
     rate = fields.Float(string='Rate')
 
+    def _get_policy_domain(self):
+        return [('overtime_rule_ids', 'in', self.ids)]
+
 
 class HrLateRule(models.Model):
     _name = 'hr.late.rule'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Late In Rules'
 
     name = fields.Char(string='name', required=True)
     line_ids = fields.One2many(comodel_name='hr.late.rule.line', inverse_name='late_id', string='Late In Periods')
 
+    def _get_policy_domain(self):
+        return [('late_rule_id', 'in', self.ids)]
+
 
 class HrLateRuleLine(models.Model):
     _name = 'hr.late.rule.line'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Late In Rule Lines'
 
     type = [
@@ -196,9 +187,13 @@ class HrLateRuleLine(models.Model):
     time = fields.Float('Time')
     amount = fields.Float('Amount')
 
+    def _get_policy_domain(self):
+        return [('late_rule_id', 'in', self.mapped('late_id').ids)]
+
 
 class HrDiffRule(models.Model):
     _name = 'hr.diff.rule'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Diff Time Rule'
 
     name = fields.Char(string='name', required=True)
@@ -206,9 +201,13 @@ class HrDiffRule(models.Model):
                                inverse_name='diff_id',
                                string='Difference time Periods')
 
+    def _get_policy_domain(self):
+        return [('diff_rule_id', 'in', self.ids)]
+
 
 class HrDiffRuleLine(models.Model):
     _name = 'hr.diff.rule.line'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Diff Time Rule Line'
     type = [
         ('fix', 'Fixed'),
@@ -221,9 +220,13 @@ class HrDiffRuleLine(models.Model):
     time = fields.Float('Time')
     amount = fields.Float('Amount')
 
+    def _get_policy_domain(self):
+        return [('diff_rule_id', 'in', self.mapped('diff_id').ids)]
+
 
 class HrAbsenceRule(models.Model):
     _name = 'hr.absence.rule'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Absence Rules'
 
     name = fields.Char(string='name', required=True)
@@ -231,9 +234,13 @@ class HrAbsenceRule(models.Model):
                                inverse_name='absence_id',
                                string='Late In Periods')
 
+    def _get_policy_domain(self):
+        return [('absence_rule_id', 'in', self.ids)]
+
 
 class HrAbsenceRuleLine(models.Model):
     _name = 'hr.absence.rule.line'
+    _inherit = 'hr.attendance.policy.rule.mixin'
     _description = 'Absence Rule Lines'
     times = [
         ('1', 'First Time'),
@@ -246,3 +253,6 @@ class HrAbsenceRuleLine(models.Model):
     absence_id = fields.Many2one(comodel_name='hr.absence.rule', string='name')
     rate = fields.Float(string='Rate', required=True)
     counter = fields.Selection(string="Times", selection=times, required=True, )
+
+    def _get_policy_domain(self):
+        return [('absence_rule_id', 'in', self.mapped('absence_id').ids)]
@@ -11,12 +11,22 @@
 #
 ##############################################################################
 
+import json
+import logging
 import pytz
+from contextlib import contextmanager
 from datetime import datetime, date, timedelta, time
 from dateutil.relativedelta import relativedelta
 from odoo import models, fields, tools, api, exceptions, _
 from odoo.exceptions import UserError, ValidationError
 import babel
+from ..utils.engine import AttendanceEngine, DayInput, float_from_time
+from ..utils.intervals import LeaveIndex
+from ..utils.np_engine import SheetInput, VectorizedAttendanceEngine
+from ..utils.profiler import PhaseProfiler
+from ..utils.tz import OffsetTable
+
+_logger = logging.getLogger(__name__)
 
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 TIME_FORMAT = "%H:%M:%S"
@@ -69,24 +79,60 @@ class AttendanceSheet(models.Model):
             raise UserError(_('You cannot delete an attendance sheet which is not draft or confirmed!'))
         return super(AttendanceSheet, self).unlink()
 
-    @api.constrains('date_from', 'date_to')
+    def init(self):
+        tools.create_index(self._cr, 'attendance_sheet_employee_dates_index',
+                           self._table, ['employee_id', 'date_from', 'date_to'])
+
+    @api.constrains('employee_id', 'date_from', 'date_to')
     def check_date(self):
-        for sheet in self:
-            emp_sheets = self.env['attendance.sheet'].search(
-                [('employee_id', '=', sheet.employee_id.id)])
-            for emp_sheet in emp_sheets:
-                if sheet.id == emp_sheet.id:
-                    continue
-                if max(sheet.date_from, emp_sheet.date_from) < min(
-                        sheet.date_to, emp_sheet.date_to):
-                    raise UserError(_(
-                        'You Have Already Attendance Sheet For That Period  Please pick another date !'))
+        if not self:
+            return
+        self.flush(['employee_id', 'date_from', 'date_to'])
+        self.env.cr.execute("""
+            SELECT sheet.id
+              FROM attendance_sheet sheet
+              JOIN attendance_sheet other
+                ON other.employee_id = sheet.employee_id
+               AND other.id != sheet.id
+               AND other.date_from < sheet.date_to
+               AND sheet.date_from < other.date_to
+             WHERE sheet.id IN %s
+             LIMIT 1
+        """, (tuple(self.ids),))
+        if self.env.cr.fetchone():
+            raise UserError(_(
+                'You Have Already Attendance Sheet For That Period  Please pick another date !'))
+
+    def _touch(self):
+        """ Bump the write date of the sheets whose lines changed, so that
+        the monthly summary picks them up on its next refresh. Called once
+        by the operations rewriting the lines of many sheets; the ones
+        updating the totals bump it through their write. """
+        if not self:
+            return
+        self.env.cr.execute("""
+            UPDATE attendance_sheet
+               SET write_date = (now() at time zone 'UTC'), write_uid = %s
+             WHERE id IN %s
+        """, (self.env.uid, tuple(self.ids)))
+        self.invalidate_cache(['write_date', 'write_uid'], self.ids)
+
+    def _check_transition(self, states, message):
+        """ Check in one pass that all the sheets are in ``states``, raising
+        ``message`` with the names of the offending sheets otherwise. """
+        invalid = self.filtered(lambda sheet: sheet.state not in states)
+        if invalid:
+            raise UserError(message % ', '.join(invalid.mapped('name')))
 
     def action_attsheet_confirm(self):
+        self._check_transition(('draft',), _(
+            'You cannot confirm the following attendance sheets in their current state: %s'))
         self.calculate_att_data()
         self.write({'state': 'confirm'})
 
     def action_attsheet_approve(self):
+        self._check_transition(('confirm',), _(
+            'You cannot approve the following attendance sheets in their current state: %s'))
         self.create_payslip()
         self.write({'state': 'done'})
 
@@ -127,50 +173,49 @@ class AttendanceSheet(models.Model):
             self.att_policy_id = self.employee_id.department_id.att_policy_id
 
     def calculate_att_data(self):
-        overtime = 0
-        no_overtime = 0
-        late = 0
-        no_late = 0
-        diff = 0
-        no_diff = 0
-        tot_wh = 0
-        no_wd = 0
-        absence_hours = 0
-        no_absence = 0
-        for att_sheet in self:
-
-            for line in att_sheet.att_sheet_line_ids:
-                # print line.date
-                if line.overtime > 0:
-                    overtime += line.overtime
-                    no_overtime = no_overtime + 1
-                if line.diff_time > 0:
-                    if line.status == "ab":
-                        no_absence += 1
-                        absence_hours += line.diff_time
-                    else:
-                        diff += line.diff_time
-                        no_diff += 1
-                if line.late_in > 0:
-                    late += line.late_in
-                    no_late += 1
-                if line.worked_hours > 0:
-                    tot_wh += line.worked_hours
-                    no_wd += 1
-            values = {
-                'tot_overtime': overtime,
-                'no_overtime': no_overtime,
-                'tot_difftime': diff,
-                'no_difftime': no_diff,
-                'no_absence': no_absence,
-                'tot_absence': absence_hours,
-                'tot_late': late,
-                'no_late': no_late,
-                # 'tot_wh': tot_wh,
-                # 'no_wd': no_wd
-
-            }
-            att_sheet.write(values)
+        """ Compute the totals of the sheets from their lines with one grouped
+        query, and write them on the sheets sharing the same totals at once. """
+        if 'att_profiler' not in self.env.context:
+            with self._att_profile('calculate_att_data') as profiler:
+                return self.with_context(att_profiler=profiler).calculate_att_data()
+        totals = ['tot_overtime', 'no_overtime', 'tot_difftime', 'no_difftime',
+                  'no_absence', 'tot_absence', 'tot_late', 'no_late']
+        sheets = self.filtered('id')
+        for att_sheet in self - sheets:
+            for fname in totals:
+                att_sheet[fname] = 0
+        if not sheets:
+            return
+        with self._att_phase('totals') as stat:
+            sheets_by_totals = {}
+            for row in self._read_att_totals(sheets):
+                sheets_by_totals.setdefault(row[1:], []).append(row[0])
+            for values, sheet_ids in sheets_by_totals.items():
+                self.browse(sheet_ids).write(dict(zip(totals, values)))
+            stat.rows = len(sheets)
+
+    def _read_att_totals(self, sheets):
+        """ Return the rows (sheet id, tot_overtime, no_overtime,
+        tot_difftime, no_difftime, no_absence, tot_absence, tot_late,
+        no_late) aggregated from the lines of ``sheets``. """
+        self.env['attendance.sheet.line'].flush(['att_sheet_id', 'overtime', 'diff_time', 'late_in', 'status'])
+        self.env.cr.execute("""
+            SELECT s.id,
+                   COALESCE(SUM(l.overtime) FILTER (WHERE l.overtime > 0), 0),
+                   COUNT(l.id) FILTER (WHERE l.overtime > 0),
+                   COALESCE(SUM(l.diff_time) FILTER (
+                       WHERE l.diff_time > 0 AND l.status IS DISTINCT FROM 'ab'), 0),
+                   COUNT(l.id) FILTER (WHERE l.diff_time > 0 AND l.status IS DISTINCT FROM 'ab'),
+                   COUNT(l.id) FILTER (WHERE l.diff_time > 0 AND l.status = 'ab'),
+                   COALESCE(SUM(l.diff_time) FILTER (WHERE l.diff_time > 0 AND l.status = 'ab'), 0),
+                   COALESCE(SUM(l.late_in) FILTER (WHERE l.late_in > 0), 0),
+                   COUNT(l.id) FILTER (WHERE l.late_in > 0)
+              FROM attendance_sheet s
+         LEFT JOIN attendance_sheet_line l ON l.att_sheet_id = s.id
+             WHERE s.id IN %s
+          GROUP BY s.id
+        """, (tuple(sheets.ids),))
+        return self.env.cr.fetchall()
 
     def _get_time_from_float(self, float_type):
         str_off_time = str(float_type)
@@ -183,72 +228,161 @@ class AttendanceSheet(models.Model):
         return str_off_time
 
     def _get_float_from_time(self, time):
-        time_type = datetime.strftime(time, "%H:%M")
-        signOnP = [int(n) for n in time_type.split(":")]
-        signOnH = signOnP[0] + signOnP[1] / 60.0
-        return signOnH
-
-    def get_attendance_intervals(self, emp, day_start, day_end):
-        tz_info = fields.Datetime.context_timestamp(self, day_start).tzinfo
-        day_st_utc = day_start.replace(tzinfo=tz_info).astimezone(pytz.utc).replace(tzinfo=None)
-        str_day_st_utc = datetime.strftime(day_st_utc, DATETIME_FORMAT)
-        day_end_utc = day_end.replace(tzinfo=tz_info).astimezone(pytz.utc).replace(tzinfo=None)
-        str_day_end_utc = datetime.strftime(day_end_utc, DATETIME_FORMAT)
-        res = []
+        return float_from_time(time)
+
+    def _get_period_attendance_intervals(self, employees, date_from, date_to, tz):
+        """ Load the closed punches of ``employees`` for the whole period with
+        one ordered query and bucket them by the local day of their check in.
+
+        :return: {employee_id: {date: [(check_in, check_out), ...]}}
+        """
+        period_start = tz.localize(datetime.combine(date_from, time.min))
+        period_end = tz.localize(datetime.combine(date_to, time.max))
+        res = {emp_id: {} for emp_id in employees.ids}
+        if not employees:
+            return res
         attendances = self.env['hr.attendance'].sudo().search(
-            [('employee_id.id', '=', emp.id),
-             ('check_in', '>=', str_day_st_utc),
-             ('check_in', '<=', str_day_end_utc)],
-            order="check_in")
-        for att in attendances:
-            check_in = att.check_in
-            check_out = att.check_out
-            if not check_out:
-                continue
-            res.append((check_in, check_out))
+            [('employee_id', 'in', employees.ids),
+             ('check_in', '>=', period_start.astimezone(pytz.utc).replace(tzinfo=None)),
+             ('check_in', '<=', period_end.astimezone(pytz.utc).replace(tzinfo=None)),
+             ('check_out', '!=', False)],
+            order="employee_id, check_in")
+        offsets = OffsetTable(tz, period_start.astimezone(pytz.utc).replace(tzinfo=None),
+                              period_end.astimezone(pytz.utc).replace(tzinfo=None))
+        for att in attendances.read(['employee_id', 'check_in', 'check_out'], load=None):
+            day = offsets.to_local(att['check_in']).date()
+            res[att['employee_id']].setdefault(day, []).append(
+                (att['check_in'], att['check_out']))
         return res
 
-    def _get_emp_leave_intervals(self, emp, start_datetime=None, end_datetime=None):
-        leaves = []
-        leave_obj = self.env['hr.leave']
-        leave_ids = leave_obj.search([
-            ('employee_id', '=', emp.id),
-            ('state', '=', 'validate')])
-
-        for leave in leave_ids:
-            date_from = leave.date_from
-            if end_datetime and date_from > end_datetime:
-                continue
-            date_to = leave.date_to
-            if start_datetime and date_to < start_datetime:
-                continue
-            leaves.append((date_from, date_to))
-        return leaves
+    def _get_period_leave_index(self, employees, date_from, date_to, tz):
+        """ Build the leave index of ``employees`` from the validated leaves
+        overlapping the period, read with one date-bounded query.
+        """
+        period_start = tz.localize(datetime.combine(date_from, time.min))
+        period_end = tz.localize(datetime.combine(date_to, time.max))
+        leaves = self.env['hr.leave'].sudo().search(
+            [('employee_id', 'in', employees.ids),
+             ('state', '=', 'validate'),
+             ('date_from', '<=', period_end.astimezone(pytz.utc).replace(tzinfo=None)),
+             ('date_to', '>=', period_start.astimezone(pytz.utc).replace(tzinfo=None))])
+        return LeaveIndex(
+            (leave['employee_id'], leave['date_from'], leave['date_to'])
+            for leave in leaves.read(['employee_id', 'date_from', 'date_to'], load=None))
 
     def get_public_holiday(self, date, emp):
-        public_holiday = []
-        public_holidays = self.env['hr.public.holiday'].sudo().search(
-            [('date_from', '<=', date), ('date_to', '>=', date),
-             ('state', '=', 'active')])
-        for ph in public_holidays:
-            print('ph is', ph.name, [e.name for e in ph.emp_ids])
-            if not ph.emp_ids:
-                return public_holidays
-            if emp.id in ph.emp_ids.ids:
-                public_holiday.append(ph.id)
-        # print str(public_holiday)
-        return public_holiday
+        date = fields.Date.to_date(date)
+        holiday_obj = self.env['hr.public.holiday']
+        calendar = holiday_obj._get_holiday_calendar(date, date)
+        return holiday_obj.is_holiday(calendar, date, emp.id)
 
     def get_attendances(self):
+        if not self:
+            return
+        if 'att_profiler' not in self.env.context:
+            with self._att_profile('get_attendances') as profiler:
+                return self.with_context(att_profiler=profiler).get_attendances()
+        holiday_obj = self.env['hr.public.holiday']
+        with self._att_phase('leaves'):
+            holiday_calendar = holiday_obj._get_holiday_calendar(
+                min(self.mapped('date_from')), max(self.mapped('date_to')))
+        notes = {
+            'ph': _("working on Public Holiday"),
+            'out': _("overtime out of work intervals"),
+            'weekend': _("working in weekend"),
+        }
+        with self._att_phase('unlink') as stat:
+            old_lines = self.mapped('att_sheet_line_ids')
+            old_lines.unlink()
+            stat.deleted = len(old_lines)
+        line_vals = []
+        vectorized_inputs = []
+        # the punches, leaves and local times of the employees sharing a
+        # timezone are loaded and converted together
+        for tz, tz_sheets in self._group_by_tz().items():
+            tz_sheets._prepare_attendance_lines(tz, notes, holiday_calendar, line_vals, vectorized_inputs)
+        if vectorized_inputs:
+            with self._att_phase('policy'):
+                engine = VectorizedAttendanceEngine(notes)
+                sheet_lines = engine.compute_sheets([sheet_input for sheet, sheet_input in vectorized_inputs])
+                for (att_sheet, sheet_input), lines in zip(vectorized_inputs, sheet_lines):
+                    for values in lines:
+                        values['att_sheet_id'] = att_sheet.id
+                        line_vals.append(values)
+        with self._att_phase('insert') as stat:
+            self.env['attendance.sheet.line'].create(line_vals)
+            stat.rows = len(line_vals)
+        self._touch()
+
+    def _append_attendance_days(self, date_from, date_to):
+        """ Compute the lines of the days from ``date_from`` to ``date_to``
+        of the sheets, replacing the lines these days may already have.
+        The sheets are expected to have no line after these days, as when
+        they are generated day by day.
+        """
+        if not self:
+            return
+        if 'att_profiler' not in self.env.context:
+            with self._att_profile('append_attendance_days') as profiler:
+                return self.with_context(att_profiler=profiler)._append_attendance_days(date_from, date_to)
+        line_obj = self.env['attendance.sheet.line']
+        with self._att_phase('unlink') as stat:
+            old_lines = line_obj.search([('att_sheet_id', 'in', self.ids),
+                                         ('date', '>=', date_from),
+                                         ('date', '<=', date_to)])
+            old_lines.unlink()
+            stat.deleted = len(old_lines)
+        line_obj.flush(['att_sheet_id', 'date', 'status'])
+        self.env.cr.execute("""
+            SELECT att_sheet_id, COUNT(DISTINCT date) FROM attendance_sheet_line
+            WHERE att_sheet_id IN %s AND status = 'ab' AND date < %s
+            GROUP BY att_sheet_id""", (tuple(self.ids), date_from))
+        abs_counts = dict(self.env.cr.fetchall())
+        holiday_obj = self.env['hr.public.holiday']
+        with self._att_phase('leaves'):
+            holiday_calendar = holiday_obj._get_holiday_calendar(date_from, date_to)
+        notes = {
+            'ph': _("working on Public Holiday"),
+            'out': _("overtime out of work intervals"),
+            'weekend': _("working in weekend"),
+        }
+        line_vals = []
+        for tz, tz_sheets in self._group_by_tz().items():
+            tz_sheets._prepare_attendance_lines(tz, notes, holiday_calendar, line_vals, [],
+                                                date_from, date_to, abs_counts)
+        with self._att_phase('insert') as stat:
+            line_obj.create(line_vals)
+            stat.rows = len(line_vals)
+        self.calculate_att_data()
+
+    def _prepare_attendance_lines(self, tz, notes, holiday_calendar, line_vals, vectorized_inputs,
+                                  date_from=None, date_to=None, abs_counts=None):
+        """ Compute the lines of sheets whose employees work in the timezone
+        ``tz`` into ``line_vals``, or add the inputs of the sheets using the
+        vectorized engine to ``vectorized_inputs``.
+
+        When ``date_from`` or ``date_to`` is given, only the days of the
+        sheets within these bounds are computed, with the scalar engine, the
+        absence counter of each sheet starting at ``abs_counts[sheet_id]``.
+        """
+        partial = bool(date_from or date_to)
+        date_from = max(date_from or date.min, min(self.mapped('date_from')))
+        date_to = min(date_to or date.max, max(self.mapped('date_to')))
+        abs_counts = abs_counts or {}
+        employees = self.mapped('employee_id')
+        with self._att_phase('punches'):
+            period_attendances = self._get_period_attendance_intervals(employees, date_from, date_to, tz)
+        with self._att_phase('leaves'):
+            leave_index = self._get_period_leave_index(employees, date_from, date_to, tz)
+        offsets = OffsetTable(tz, datetime.combine(date_from, time.min), datetime.combine(date_to, time.max))
+        holiday_obj = self.env['hr.public.holiday']
         for att_sheet in self:
-            att_sheet.att_sheet_line_ids.unlink()
-            att_line = self.env["attendance.sheet.line"]
-            from_date = att_sheet.date_from
-            to_date = att_sheet.date_to
+            from_date = max(att_sheet.date_from, date_from)
+            to_date = min(att_sheet.date_to, date_to)
+            if from_date > to_date:
+                continue
             emp = att_sheet.employee_id
-            tz = pytz.timezone(self.env.user.tz)
-            if not tz:
-                raise exceptions.Warning("Please add time zone for the current user %s" % self.env.user.name)
+            emp_attendances = period_attendances[emp.id]
             calendar_id = emp.contract_id.resource_calendar_id
             if not calendar_id:
                 raise ValidationError(_('Please add working hours to the %s `s contract ' % emp.name))
@@ -257,273 +391,143 @@ class AttendanceSheet(models.Model):
             if not policy_id:
                 raise ValidationError(_('Please add Attendance Policy to the %s `s contract ' % emp.name))
 
+            with self._att_phase('schedule'):
+                work_intervals_by_day = calendar_id.att_get_work_intervals_by_day(from_date, to_date, tz)
             all_dates = [(from_date + timedelta(days=x)) for x in
                          range((to_date - from_date).days + 1)]
-            abs_cnt = 0
-            for day in all_dates:
-                day_start = datetime(day.year, day.month, day.day)
-                tz_info = fields.Datetime.context_timestamp(self, fields.Datetime.from_string(day_start)).tzinfo
-                print('day is', day, type(day))
-                day_end = day_start.replace(hour=23, minute=59, second=59)
-                day_str = str(day.weekday())
-                date = day.strftime('%Y-%m-%d')
-                work_intervals = calendar_id.att_get_work_intervals(day_start, day_end)
-                attendance_intervals = self.get_attendance_intervals(emp, day_start, day_end)
-                leaves = self._get_emp_leave_intervals(emp, day_start, day_end)
-                public_holiday = self.get_public_holiday(date, emp)
-                reserved_intervals = []
-                overtime_policy = policy_id.get_overtime()
-                abs_flag = False
-                if work_intervals:
-                    if public_holiday:
-                        if attendance_intervals:
-                            for attendance_interval in attendance_intervals:
-                                overtime = attendance_interval[1] - attendance_interval[0]
-                                float_overtime = overtime.total_seconds() / 3600
-                                if float_overtime <= overtime_policy['ph_after']:
-                                    act_float_overtime = float_overtime = 0
-                                else:
-                                    act_float_overtime = (float_overtime - overtime_policy['ph_after'])
-                                    float_overtime = (float_overtime -
-                                                      overtime_policy[
-                                                          'ph_after']) * \
-                                                     overtime_policy['ph_rate']
-                                ac_sign_in = pytz.utc.localize(attendance_interval[0]).astimezone(tz)
-                                float_ac_sign_in = self._get_float_from_time(ac_sign_in)
-                                ac_sign_out = pytz.utc.localize(attendance_interval[1]).astimezone(tz)
-                                worked_hours = attendance_interval[1] - attendance_interval[0]
-                                float_worked_hours = worked_hours.total_seconds() / 3600
-                                float_ac_sign_out = float_ac_sign_in + float_worked_hours
-                                values = {
-                                    'date': date,
-                                    'day': day_str,
-                                    'ac_sign_in': float_ac_sign_in,
-                                    'ac_sign_out': float_ac_sign_out,
-                                    'worked_hours': float_worked_hours,
-                                    'o_worked_hours': float_worked_hours,
-                                    'overtime': float_overtime,
-                                    'act_overtime': float_overtime,
-                                    'att_sheet_id': self.id,
-                                    'status': 'ph',
-                                    'note': _("working on Public Holiday")
-                                }
-                                att_line.create(values)
-                        else:
-                            values = {
-                                'date': date,
-                                'day': day_str,
-                                'att_sheet_id': self.id,
-                                'status': 'ph',
-                            }
-                            att_line.create(values)
-                    else:
-                        for i, work_interval in enumerate(work_intervals):
-                            float_worked_hours = 0
-                            att_work_intervals = []
-                            diff_intervals = []
-                            late_in_interval = []
-                            diff_time = timedelta(hours=00, minutes=00, seconds=00)
-                            late_in = timedelta(hours=00, minutes=00, seconds=00)
-                            overtime = timedelta(hours=00, minutes=00, seconds=00)
-                            for j, att_interval in enumerate(attendance_intervals):
-                                if max(work_interval[0], att_interval[0]) < min(work_interval[1], att_interval[1]):
-                                    current_att_interval = att_interval
-                                    if i + 1 < len(work_intervals):
-                                        next_work_interval = work_intervals[i + 1]
-                                        if max(next_work_interval[0], current_att_interval[0]) < min(
-                                                next_work_interval[1], current_att_interval[1]):
-                                            split_att_interval = (next_work_interval[0], current_att_interval[1])
-                                            current_att_interval = (current_att_interval[0], next_work_interval[0])
-                                            attendance_intervals[j] = current_att_interval
-                                            attendance_intervals.insert(j + 1, split_att_interval)
-                                    att_work_intervals.append(current_att_interval)
-                            reserved_intervals += att_work_intervals
-                            pl_sign_in = self._get_float_from_time(pytz.utc.localize(work_interval[0]).astimezone(tz))
-                            pl_sign_out = self._get_float_from_time(pytz.utc.localize(work_interval[1]).astimezone(tz))
-                            pl_sign_in_time = pytz.utc.localize(work_interval[0]).astimezone(tz)
-                            pl_sign_out_time = pytz.utc.localize(work_interval[1]).astimezone(tz)
-                            ac_sign_in = 0
-                            ac_sign_out = 0
-                            status = ""
-                            note = ""
-                            if att_work_intervals:
-                                if len(att_work_intervals) > 1:
-                                    # print("there is more than one interval for that work interval")
-                                    late_in_interval = (work_interval[0], att_work_intervals[0][0])
-                                    overtime_interval = (work_interval[1], att_work_intervals[-1][1])
-                                    if overtime_interval[1] < overtime_interval[0]:
-                                        overtime = timedelta(hours=0, minutes=0, seconds=0)
-                                    else:
-                                        overtime = overtime_interval[1] - overtime_interval[0]
-                                    remain_interval = (att_work_intervals[0][1], work_interval[1])
-                                    # print'first remain intervals is',remain_interval
-                                    for att_work_interval in att_work_intervals:
-                                        float_worked_hours += (att_work_interval[1] - att_work_interval[
-                                            0]).total_seconds() / 3600
-                                        # print'float worked hors is', float_worked_hours
-                                        if att_work_interval[1] <= \
-                                                remain_interval[0]:
-                                            continue
-                                        if att_work_interval[0] >= \
-                                                remain_interval[1]:
-                                            break
-                                        if remain_interval[0] < att_work_interval[0] < remain_interval[1]:
-                                            diff_intervals.append((remain_interval[0], att_work_interval[0]))
-                                            remain_interval = (att_work_interval[1], remain_interval[1])
-                                    if remain_interval and remain_interval[0] <= work_interval[1]:
-                                        diff_intervals.append((remain_interval[0], work_interval[1]))
-                                    ac_sign_in = self._get_float_from_time(
-                                        pytz.utc.localize(att_work_intervals[0][0]).astimezone(tz))
-                                    ac_sign_out = self._get_float_from_time(
-                                        pytz.utc.localize(att_work_intervals[-1][1]).astimezone(tz))
-                                    ac_sign_out = ac_sign_in + ((att_work_intervals[-1][1] -
-                                                                 att_work_intervals[0][0]).total_seconds() / 3600)
-                                else:
-                                    late_in_interval = (work_interval[0], att_work_intervals[0][0])
-                                    overtime_interval = (work_interval[1], att_work_intervals[-1][1])
-                                    if overtime_interval[1] < overtime_interval[0]:
-                                        overtime = timedelta(hours=0, minutes=0, seconds=0)
-                                        diff_intervals.append((overtime_interval[1], overtime_interval[0]))
-                                    else:
-                                        overtime = overtime_interval[1] - overtime_interval[0]
-                                    ac_sign_in = self._get_float_from_time(
-                                        pytz.utc.localize(att_work_intervals[0][0]).astimezone(tz))
-                                    ac_sign_out = self._get_float_from_time(
-                                        pytz.utc.localize(att_work_intervals[0][1]).astimezone(tz))
-                                    worked_hours = att_work_intervals[0][1] - att_work_intervals[0][0]
-                                    float_worked_hours = worked_hours.total_seconds() / 3600
-                                    ac_sign_out = ac_sign_in + float_worked_hours
-                            else:
-                                late_in_interval = []
-                                diff_intervals.append((work_interval[0], work_interval[1]))
-
-                                status = "ab"
-                            if diff_intervals:
-                                for diff_in in diff_intervals:
-                                    if leaves:
-                                        status = "leave"
-                                        diff_clean_intervals = calendar_id.att_interval_without_leaves(diff_in, leaves)
-                                        for diff_clean in diff_clean_intervals:
-                                            diff_time += diff_clean[1] - diff_clean[0]
-                                    else:
-                                        diff_time += diff_in[1] - diff_in[0]
-                            if late_in_interval:
-                                if late_in_interval[1] < late_in_interval[0]:
-                                    late_in = timedelta(hours=0, minutes=0, seconds=0)
-                                else:
-                                    if leaves:
-                                        late_clean_intervals = calendar_id.att_interval_without_leaves(late_in_interval,
-                                                                                                       leaves)
-                                        for late_clean in late_clean_intervals:
-                                            late_in += late_clean[1] - late_clean[0]
-                                    else:
-                                        late_in = late_in_interval[1] - late_in_interval[0]
-                            float_overtime = overtime.total_seconds() / 3600
-                            if float_overtime <= overtime_policy['wd_after']:
-                                act_float_overtime = float_overtime = 0
-                            else:
-                                float_overtime = float_overtime * overtime_policy['wd_rate']
-                                act_float_overtime = (float_overtime - overtime_policy['wd_after'])
-                                float_overtime = float_overtime * overtime_policy['wd_rate']
-                            float_late = late_in.total_seconds() / 3600
-                            act_float_late = late_in.total_seconds() / 3600
-                            policy_late = policy_id.get_late(float_late)
-                            float_diff = diff_time.total_seconds() / 3600
-                            if status == 'ab':
-                                if not abs_flag:
-                                    abs_cnt += 1
-                                abs_flag = True
-
-                                act_float_diff = float_diff
-                                float_diff = policy_id.get_absence(float_diff, abs_cnt)
-                            else:
-                                act_float_diff = float_diff
-                                float_diff = policy_id.get_diff(float_diff)
-                            values = {
-                                'date': date,
-                                'day': day_str,
-                                'pl_sign_in': pl_sign_in,
-                                'pl_sign_out': pl_sign_out,
-                                'ac_sign_in': ac_sign_in,
-                                'ac_sign_out': ac_sign_out,
-                                'late_in': policy_late,
-                                'act_late_in': act_float_late,
-                                'overtime': float_overtime,
-                                'act_overtime': act_float_overtime,
-                                'diff_time': float_diff,
-                                'act_diff_time': act_float_diff,
-                                'status': status,
-                                'att_sheet_id': self.id
-                            }
-                            att_line.create(values)
-                        out_work_intervals = [x for x in attendance_intervals if
-                                              x not in reserved_intervals]
-                        if out_work_intervals:
-                            for att_out in out_work_intervals:
-                                overtime = att_out[1] - att_out[0]
-                                ac_sign_in = self._get_float_from_time(pytz.utc.localize(att_out[0]).astimezone(tz))
-                                ac_sign_out = self._get_float_from_time(pytz.utc.localize(att_out[1]).astimezone(tz))
-                                float_worked_hours = overtime.total_seconds() / 3600
-                                ac_sign_out = ac_sign_in + float_worked_hours
-                                float_overtime = overtime.total_seconds() / 3600
-                                if float_overtime <= overtime_policy['wd_after']:
-                                    float_overtime = act_float_overtime = 0
-                                else:
-                                    act_float_overtime = (float_overtime - overtime_policy['ph_after'])
-                                    float_overtime = float_overtime * overtime_policy['wd_rate']
-                                values = {
-                                    'date': date,
-                                    'day': day_str,
-                                    'pl_sign_in': 0,
-                                    'pl_sign_out': 0,
-                                    'ac_sign_in': ac_sign_in,
-                                    'ac_sign_out': ac_sign_out,
-                                    'overtime': float_overtime,
-                                    'worked_hours': float_worked_hours,
-                                    'act_overtime': act_float_overtime,
-                                    'note': _("overtime out of work intervals"),
-                                    'att_sheet_id': self.id
-                                }
-                                att_line.create(values)
-                else:
-                    if attendance_intervals:
-                        # print "thats weekend be over time "
-                        for attendance_interval in attendance_intervals:
-                            overtime = attendance_interval[1] - attendance_interval[0]
-                            ac_sign_in = pytz.utc.localize(attendance_interval[0]).astimezone(tz)
-                            ac_sign_out = pytz.utc.localize(attendance_interval[1]).astimezone(tz)
-                            float_overtime = overtime.total_seconds() / 3600
-                            if float_overtime <= overtime_policy['we_after']:
-                                float_overtime = 0
-                            else:
-                                act_float_overtime = (float_overtime - overtime_policy['we_after'])
-                                float_overtime = float_overtime * overtime_policy['we_rate']
-                            ac_sign_in = pytz.utc.localize(attendance_interval[0]).astimezone(tz)
-                            ac_sign_out = pytz.utc.localize(attendance_interval[1]).astimezone(tz)
-                            worked_hours = attendance_interval[1] - attendance_interval[0]
-                            float_worked_hours = worked_hours.total_seconds() / 3600
-                            values = {
-                                'date': date,
-                                'day': day_str,
-                                'ac_sign_in': self._get_float_from_time(ac_sign_in),
-                                'ac_sign_out': self._get_float_from_time(ac_sign_out),
-                                'overtime': float_overtime,
-                                'act_overtime': float_overtime,
-                                'worked_hours': float_worked_hours,
-                                'att_sheet_id': self.id,
-                                'status': 'weekend',
-                                'note': _("working in weekend")
-                            }
-                            att_line.create(values)
-                    else:
-                        values = {
-                            'date': date,
-                            'day': day_str,
-                            'att_sheet_id': self.id,
-                            'status': 'weekend',
-                            'note': ""
-                        }
-                        att_line.create(values)
+            days = [DayInput(day, work_intervals_by_day[day], emp_attendances.get(day, ()),
+                             holiday_obj.is_holiday(holiday_calendar, day, emp.id))
+                    for day in all_dates]
+            with self._att_phase('policy'):
+                sheet_input = SheetInput(policy_id._get_evaluator(), tz, days, leave_index.get_leaves(emp.id))
+                if att_sheet.batch_id.engine == 'numpy' and not partial:
+                    vectorized_inputs.append((att_sheet, sheet_input))
+                    continue
+                engine = AttendanceEngine(sheet_input.policy, tz, notes, offsets)
+                for values in engine.compute_sheet(days, sheet_input.leaves, abs_counts.get(att_sheet.id, 0)):
+                    values['att_sheet_id'] = att_sheet.id
+                    line_vals.append(values)
+
+    @contextmanager
+    def _att_profile(self, operation, batch=None):
+        """ Start an instrumented run and yield its phase profiler. Once the
+        run is over, its summary is logged as JSON and, for a batch, stored
+        as a run record of the batch.
+        """
+        profiler = PhaseProfiler(self.env.cr)
+        yield profiler
+        summary = profiler.get_summary()
+        summary.update(operation=operation, batch_id=batch.id if batch else False,
+                       sheet_ids=self.ids if not batch else [])
+        _logger.log(logging.INFO if batch else logging.DEBUG,
+                    "attendance sheet run: %s", json.dumps(summary, default=str))
+        if batch:
+            batch._save_run(operation, summary)
+
+    def _att_phase(self, name):
+        """ Return a context manager measuring the phase ``name`` of the
+        current run. """
+        profiler = self.env.context.get('att_profiler') or PhaseProfiler(self.env.cr)
+        return profiler.phase(name, self.env.cr)
+
+    @api.model
+    def _get_employee_tz(self, employee):
+        """ Return the timezone of the punches of ``employee``: the one of
+        its resource, else of the working hours of its contract. """
+        return pytz.timezone(employee.tz or employee.contract_id.resource_calendar_id.tz or 'UTC')
+
+    def _get_attendance_tz(self):
+        self.ensure_one()
+        return self._get_employee_tz(self.employee_id)
+
+    def _group_by_tz(self):
+        """ Return {timezone: sheets} of the sheets grouped by the timezone
+        of their employee. """
+        res = {}
+        for att_sheet in self:
+            tz = att_sheet._get_attendance_tz()
+            res[tz] = res.get(tz, self.browse()) | att_sheet
+        return res
+
+    @api.model
+    def _recompute_attendance_days(self, employee_days):
+        """ Recompute the lines of the draft sheets covering some days,
+        leaving alone the sheets whose lines are not generated yet.
+
+        :param employee_days: {employee_id: set of dates}
+        """
+        employee_days = {emp_id: days for emp_id, days in employee_days.items() if days}
+        if not employee_days:
+            return
+        dates = set().union(*employee_days.values())
+        sheets = self.search([('employee_id', 'in', list(employee_days)),
+                              ('state', '=', 'draft'),
+                              ('date_from', '<=', max(dates)),
+                              ('date_to', '>=', min(dates))])
+        for sheet in sheets:
+            if not sheet.att_sheet_line_ids:
+                # the lines of the sheet are not generated yet
+                continue
+            date_to = sheet.date_to
+            if sheet.batch_id.rolling:
+                # the following days are appended by the nightly job
+                date_to = min(date_to, sheet.batch_id.rolled_to or date.min)
+            days = sorted(day for day in employee_days[sheet.employee_id.id]
+                          if sheet.date_from <= day <= date_to)
+            if days:
+                sheet._recompute_days(days)
+
+    def _recompute_days(self, days):
+        """ Replace the lines of ``days`` by freshly computed ones, keeping
+        the absence counter of the sheet consistent, and update the totals.
+        """
+        self.ensure_one()
+        emp = self.employee_id
+        calendar_id = emp.contract_id.resource_calendar_id
+        if not calendar_id or not self.att_policy_id:
+            return
+        tz = self._get_attendance_tz()
+        policy = self.att_policy_id._get_evaluator()
+        offsets = OffsetTable(tz, datetime.combine(days[0], time.min), datetime.combine(days[-1], time.max))
+        engine = AttendanceEngine(policy, tz, {
+            'ph': _("working on Public Holiday"),
+            'out': _("overtime out of work intervals"),
+            'weekend': _("working in weekend"),
+        }, offsets)
+        punches = self._get_period_attendance_intervals(emp, days[0], days[-1], tz)[emp.id]
+        leave_set = self._get_period_leave_index(emp, days[0], days[-1], tz).get_leave_set(emp.id)
+        holiday_obj = self.env['hr.public.holiday']
+        holiday_calendar = holiday_obj._get_holiday_calendar(days[0], days[-1])
+        work_intervals_by_day = calendar_id.att_get_work_intervals_by_day(self.date_from, self.date_to, tz)
+
+        absent_dates = set(self.att_sheet_line_ids.filtered(lambda l: l.status == 'ab').mapped('date'))
+        absence_changed = False
+        line_vals = []
+        for day in days:
+            abs_cnt = len([absent for absent in absent_dates if absent < day])
+            day_lines, new_abs_cnt = engine.compute_day(
+                DayInput(day, work_intervals_by_day[day], punches.get(day, ()),
+                         holiday_obj.is_holiday(holiday_calendar, day, emp.id)),
+                leave_set, abs_cnt)
+            if (new_abs_cnt > abs_cnt) != (day in absent_dates):
+                absence_changed = True
+                absent_dates ^= {day}
+            for values in day_lines:
+                values['att_sheet_id'] = self.id
+                line_vals.append(values)
+        self.att_sheet_line_ids.filtered(lambda l: l.date in days).unlink()
+        self.env['attendance.sheet.line'].create(line_vals)
+        if absence_changed:
+            # the absence counter of the following days moved
+            for line in self.att_sheet_line_ids.filtered(lambda l: l.status == 'ab' and l.date > days[0]):
+                abs_cnt = len([absent for absent in absent_dates if absent <= line.date])
+                diff_time = policy.get_absence(line.act_diff_time, abs_cnt)
+                if diff_time != line.diff_time:
+                    line.diff_time = diff_time
+        self.calculate_att_data()
+
+    def action_export_lines(self):
+        return self.env['attendance.sheet.line']._get_export_action(self._name, self.ids)
 
     def action_payslip(self):
         self.ensure_one()
@@ -539,74 +543,130 @@ class AttendanceSheet(models.Model):
             'views': [(False, 'form')],
         }
 
-    def create_payslip(self):
-        payslips = self.env['hr.payslip']
+    def _get_period_contracts(self):
+        """ Return {employee_id: contracts} of the running contracts covering
+        each sheet period, read with one query per period like
+        ``hr.payslip.get_contract``.
+        """
+        res = {}
+        periods = {}
         for att_sheet in self:
-            if att_sheet.payslip_id:
-                continue
+            periods.setdefault((att_sheet.date_from, att_sheet.date_to), set()).add(att_sheet.employee_id.id)
+        for (date_from, date_to), employee_ids in periods.items():
+            clause_1 = ['&', ('date_end', '<=', date_to), ('date_end', '>=', date_from)]
+            clause_2 = ['&', ('date_start', '<=', date_to), ('date_start', '>=', date_from)]
+            clause_3 = ['&', ('date_start', '<=', date_from), '|', ('date_end', '=', False),
+                        ('date_end', '>=', date_to)]
+            contracts = self.env['hr.contract'].search(
+                [('employee_id', 'in', list(employee_ids)), ('state', '=', 'open'),
+                 '|', '|'] + clause_1 + clause_2 + clause_3, order='date_start desc, id desc')
+            for contract in contracts:
+                key = (contract.employee_id.id, date_from, date_to)
+                res[key] = res.get(key, self.env['hr.contract']) | contract
+        return res
+
+    def _prepare_attendance_worked_days(self, contract_id):
+        self.ensure_one()
+        return [{
+            'name': "Overtime",
+            'code': 'OVT',
+            'contract_id': contract_id,
+            'sequence': 30,
+            'number_of_days': self.no_overtime,
+            'number_of_hours': self.tot_overtime,
+        }, {
+            'name': "Late In",
+            'code': 'LATE',
+            'contract_id': contract_id,
+            'sequence': 40,
+            'number_of_days': self.no_late,
+            'number_of_hours': self.tot_late,
+        }, {
+            'name': "Absence",
+            'code': 'ABS',
+            'contract_id': contract_id,
+            'sequence': 35,
+            'number_of_days': self.no_absence,
+            'number_of_hours': self.tot_absence,
+        }, {
+            'name': "Difference time",
+            'code': 'DIFFT',
+            'contract_id': contract_id,
+            'sequence': 45,
+            'number_of_days': self.no_difftime,
+            'number_of_hours': self.tot_difftime,
+        }]
+
+    def create_payslip(self):
+        """ Create the payslips of the sheets at once: contracts, worked days
+        and inputs are resolved for all the sheets of a period together, and
+        the payslips are created in the payslip batch of the sheet batch.
+        """
+        if 'att_profiler' not in self.env.context:
+            with self._att_profile('create_payslip') as profiler:
+                return self.with_context(att_profiler=profiler).create_payslip()
+        payslip_obj = self.env['hr.payslip']
+        sheets = self.filtered(lambda att_sheet: not att_sheet.payslip_id)
+        if not sheets:
+            return payslip_obj
+        with self._att_phase('contracts'):
+            contracts_by_sheet = sheets._get_period_contracts()
+        locale = self.env.context.get('lang') or 'en_US'
+        worked_days = {}
+        inputs = {}
+        periods = {}
+        for att_sheet in sheets:
+            key = (att_sheet.employee_id.id, att_sheet.date_from, att_sheet.date_to)
+            if key not in contracts_by_sheet:
+                raise exceptions.Warning(
+                    'There is No Contracts for %s That covers the period of the Attendance sheet'
+                    % att_sheet.employee_id.name)
+            periods.setdefault(key[1:], self.env['hr.contract'])
+            periods[key[1:]] |= contracts_by_sheet[key]
+        with self._att_phase('worked_days'):
+            for (date_from, date_to), contracts in periods.items():
+                for line in payslip_obj.get_worked_day_lines(contracts, date_from, date_to):
+                    worked_days.setdefault((line['contract_id'], date_from, date_to), []).append(line)
+                for line in payslip_obj.get_inputs(contracts, date_from, date_to):
+                    inputs.setdefault((line['contract_id'], date_from, date_to), []).append(line)
+
+        vals_list = []
+        for att_sheet in sheets:
+            employee = att_sheet.employee_id
             from_date = att_sheet.date_from
             to_date = att_sheet.date_to
-            employee = att_sheet.employee_id
-            slip_data = self.env['hr.payslip'].onchange_employee_id(from_date,
-                                                                    to_date,
-                                                                    employee.id,
-                                                                    contract_id=False)
-            contract_id = slip_data['value'].get('contract_id')
-            if not contract_id:
-                raise exceptions.Warning(
-                    'There is No Contracts for %s That covers the period of the Attendance sheet' % employee.name)
-            worked_days_line_ids = slip_data['value'].get('worked_days_line_ids')
-
-            overtime = [{
-                'name': "Overtime",
-                'code': 'OVT',
-                'contract_id': contract_id,
-                'sequence': 30,
-                'number_of_days': att_sheet.no_overtime,
-                'number_of_hours': att_sheet.tot_overtime,
-            }]
-            absence = [{
-                'name': "Absence",
-                'code': 'ABS',
-                'contract_id': contract_id,
-                'sequence': 35,
-                'number_of_days': att_sheet.no_absence,
-                'number_of_hours': att_sheet.tot_absence,
-            }]
-            late = [{
-                'name': "Late In",
-                'code': 'LATE',
-                'contract_id': contract_id,
-                'sequence': 40,
-                'number_of_days': att_sheet.no_late,
-                'number_of_hours': att_sheet.tot_late,
-            }]
-            difftime = [{
-                'name': "Difference time",
-                'code': 'DIFFT',
-                'contract_id': contract_id,
-                'sequence': 45,
-                'number_of_days': att_sheet.no_difftime,
-                'number_of_hours': att_sheet.tot_difftime,
-            }]
-            worked_days_line_ids += overtime + late + absence + difftime
-
-            res = {
+            contracts = contracts_by_sheet[(employee.id, from_date, to_date)]
+            # the latest contract of the period, whatever the search order
+            contract = contracts.sorted(lambda c: (c.date_start, c.id), reverse=True)[0]
+            worked_days_line_ids = []
+            input_line_ids = []
+            for contract_id in contracts.ids:
+                worked_days_line_ids += worked_days.get((contract_id, from_date, to_date), [])
+                input_line_ids += inputs.get((contract_id, from_date, to_date), [])
+            worked_days_line_ids += att_sheet._prepare_attendance_worked_days(contract.id)
+            ttyme = datetime.combine(from_date, time.min)
+            vals_list.append({
                 'employee_id': employee.id,
-                'name': slip_data['value'].get('name'),
-                'struct_id': slip_data['value'].get('struct_id'),
-                'contract_id': contract_id,
-                'input_line_ids': [(0, 0, x) for x in
-                                   slip_data['value'].get('input_line_ids')],
-                'worked_days_line_ids': [(0, 0, x) for x in
-                                         worked_days_line_ids],
+                'name': _('Salary Slip of %s for %s') % (employee.name, tools.ustr(
+                    babel.dates.format_date(date=ttyme, format='MMMM-y', locale=locale))),
+                'company_id': employee.company_id.id,
+                'struct_id': contract.struct_id.id,
+                'contract_id': contract.id,
+                'payslip_run_id': att_sheet.batch_id.payslip_batch_id.id,
+                'input_line_ids': [(0, 0, x) for x in input_line_ids],
+                'worked_days_line_ids': [(0, 0, x) for x in worked_days_line_ids],
                 'date_from': from_date,
                 'date_to': to_date,
-            }
-            print(res)
-            new_payslip = self.env['hr.payslip'].create(res)
-            att_sheet.payslip_id = new_payslip
-            payslips += new_payslip
+            })
+        with self._att_phase('payslips') as stat:
+            payslips = payslip_obj.create(vals_list)
+            sheets_by_payslip = {}
+            for att_sheet, payslip in zip(sheets, payslips):
+                sheets_by_payslip.setdefault(payslip, self.browse())
+                sheets_by_payslip[payslip] |= att_sheet
+            for payslip, payslip_sheets in sheets_by_payslip.items():
+                payslip_sheets.write({'payslip_id': payslip.id})
+            stat.rows = len(payslips)
         return payslips
 
 
@@ -654,3 +714,78 @@ class AttendanceSheetLine(models.Model):
                                          ('leave', 'Leave'), ],
                               required=False, readonly=True)
     note = fields.Text("Note", readonly=True)
+
+    def init(self):
+        tools.create_index(self._cr, 'attendance_sheet_line_sheet_date_index',
+                           self._table, ['att_sheet_id', 'date'])
+
+    _export_fields = ['date', 'day', 'pl_sign_in', 'pl_sign_out', 'ac_sign_in', 'ac_sign_out',
+                      'worked_hours', 'late_in', 'act_late_in', 'overtime', 'act_overtime',
+                      'diff_time', 'act_diff_time', 'status', 'note']
+
+    @api.model
+    def _get_export_header(self):
+        return [_('Employee'), _('Department'), _('Attendance Policy'), _('Attendance Sheet')] + \
+               [self._fields[name].get_description(self.env)['string'] for name in self._export_fields]
+
+    @api.model
+    def _get_export_action(self, model, ids):
+        export_format = self.env.context.get('export_format', 'csv')
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/hr_geotagging/export/%s/%s?export_format=%s' % (
+                model, ','.join(str(res_id) for res_id in ids), export_format),
+            'target': 'self',
+        }
+
+    @api.model
+    def _get_export_sheet_ids(self, model, ids):
+        """ Return the ids of the sheets to export for records of ``model``,
+        checking that the user can read them. """
+        if model == 'attendance.sheet.batch':
+            domain = [('batch_id', 'in', ids)]
+        elif model == 'attendance.sheet':
+            domain = [('id', 'in', ids)]
+        else:
+            raise UserError(_("Attendance lines can not be exported from %s.") % model)
+        return self.env['attendance.sheet'].search(domain).ids
+
+    @api.model
+    def _iter_export_rows(self, sheet_ids, chunk_size=2000):
+        """ Yield the export rows of the lines of the given sheets, fetched by
+        chunks of ``chunk_size`` lines with keyset pagination on
+        (att_sheet_id, id), the names of the related records being joined in
+        the same query. Only one chunk is held in memory at a time.
+        """
+        self.flush()
+        selections = {
+            name: dict(self._fields[name]._description_selection(self.env))
+            for name in ('day', 'status')
+        }
+        columns = ', '.join('l.%s' % name for name in self._export_fields)
+        query = """
+            SELECT l.att_sheet_id, l.id, e.name, d.name, p.name, s.name, %s
+            FROM attendance_sheet_line l
+            JOIN attendance_sheet s ON s.id = l.att_sheet_id
+            JOIN hr_employee e ON e.id = s.employee_id
+            LEFT JOIN hr_department d ON d.id = e.department_id
+            LEFT JOIN hr_attendance_policy p ON p.id = s.att_policy_id
+            WHERE l.att_sheet_id = ANY(%%s) AND (l.att_sheet_id, l.id) > (%%s, %%s)
+            ORDER BY l.att_sheet_id, l.id
+            LIMIT %%s""" % columns
+        day_index = 6 + self._export_fields.index('day')
+        status_index = 6 + self._export_fields.index('status')
+        last = (0, 0)
+        while True:
+            self.env.cr.execute(query, (list(sheet_ids), last[0], last[1], chunk_size))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                return
+            for row in rows:
+                row = list(row)
+                row[day_index] = selections['day'].get(row[day_index], '')
+                row[status_index] = selections['status'].get(row[status_index], '')
+                yield row[2:]
+            last = rows[-1][:2]
+            if len(rows) < chunk_size:
+                return
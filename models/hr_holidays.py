@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-
+from datetime import timedelta
 from odoo import models, fields, tools, api, exceptions, _
 
 
@@ -57,3 +57,53 @@ class HrPublicHoliday(models.Model):
                     emp_ids.append(employee.id)
             self.emp_ids = self.env['hr.employee'].search(
                 [('id', 'in', emp_ids)])
+
+    def _get_target_employee_ids(self):
+        """ Return the ids of the employees targeted by the holiday, or None
+        when it applies to everybody.
+        """
+        self.ensure_one()
+        employees = self.emp_ids
+        if self.type_select == 'dep' and self.dep_ids:
+            employees |= self.env['hr.employee'].search(
+                [('department_id', 'in', self.dep_ids.ids)])
+        elif self.type_select == 'tag' and self.cat_ids:
+            employees |= self.env['hr.employee'].search(
+                [('category_ids', 'in', self.cat_ids.ids)])
+        elif not employees:
+            return None
+        return frozenset(employees.ids)
+
+    @api.model
+    def _get_holiday_calendar(self, date_from, date_to):
+        """ Resolve the active holidays overlapping the period once. The
+        callers keep the result for the sheets they compute: it is not
+        cached across calls, since the employees targeted by department or
+        tag change with the employees.
+
+        :return: {date: True | frozenset(employee_ids)}, True meaning the
+                 day is a holiday for every employee
+        """
+        calendar = {}
+        holidays = self.sudo().search([('date_from', '<=', date_to),
+                                       ('date_to', '>=', date_from),
+                                       ('state', '=', 'active')])
+        for holiday in holidays:
+            emp_ids = holiday._get_target_employee_ids()
+            day = max(holiday.date_from, date_from)
+            while day <= min(holiday.date_to, date_to):
+                current = calendar.get(day, frozenset())
+                if emp_ids is None or current is True:
+                    calendar[day] = True
+                else:
+                    calendar[day] = current | emp_ids
+                day += timedelta(days=1)
+        return calendar
+
+    @api.model
+    def is_holiday(self, calendar, day, emp_id):
+        """ Whether ``day`` is a holiday for ``emp_id`` in a calendar returned
+        by :meth:`_get_holiday_calendar`.
+        """
+        emp_ids = calendar.get(day)
+        return emp_ids is True or bool(emp_ids and emp_id in emp_ids)
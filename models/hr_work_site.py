@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+import json
+from odoo import models, fields, tools, api, _
+from odoo.exceptions import ValidationError
+from ..utils.geo import GeoFence, GeoFenceIndex
+
+
+class HrWorkSite(models.Model):
+    _name = 'hr.work.site'
+    _description = 'Work Site'
+
+    name = fields.Char(string='Name', required=True)
+    active = fields.Boolean(string='Active', default=True)
+    company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
+    fence_type = fields.Selection([
+        ('radius', 'Radius'),
+        ('polygon', 'Polygon')], string='Geofence', default='radius', required=True)
+    latitude = fields.Float(string='Latitude', digits=(10, 7))
+    longitude = fields.Float(string='Longitude', digits=(10, 7))
+    radius = fields.Float(string='Radius (m)', default=100)
+    polygon = fields.Text(string='Polygon', help='JSON list of [latitude, longitude] points')
+
+    @api.constrains('fence_type', 'polygon', 'radius')
+    def _check_fence(self):
+        for site in self:
+            if site.fence_type == 'polygon':
+                try:
+                    points = json.loads(site.polygon or '')
+                    valid = len(points) >= 3 and all(len(point) == 2 for point in points)
+                except (ValueError, TypeError):
+                    valid = False
+                if not valid:
+                    raise ValidationError(_("The polygon of %s must be a JSON list of at least three "
+                                            "[latitude, longitude] points.") % site.name)
+            elif site.radius <= 0:
+                raise ValidationError(_("The radius of %s must be positive.") % site.name)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super(HrWorkSite, self).create(vals_list)
+
+    def write(self, vals):
+        self.clear_caches()
+        return super(HrWorkSite, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(HrWorkSite, self).unlink()
+
+    def _get_fence(self):
+        self.ensure_one()
+        if self.fence_type == 'polygon':
+            return GeoFence(self.id, polygon=[tuple(point) for point in json.loads(self.polygon)])
+        return GeoFence(self.id, self.latitude, self.longitude, self.radius)
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_fence_index(self, company_id):
+        """ Return the geofence index of the active sites of a company, kept
+        by every worker until a site changes. """
+        sites = self.sudo().search([('company_id', 'in', [company_id, False])])
+        return GeoFenceIndex([site._get_fence() for site in sites])
+
+    @api.model
+    def locate(self, latitude, longitude, company_id=None):
+        """ Return the id of the work site holding the point, or None. """
+        index = self._get_fence_index(company_id or self.env.company.id)
+        return index.locate(latitude, longitude)
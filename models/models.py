@@ -20,6 +20,9 @@ class HrDepartment(models.Model):
     _inherit = 'hr.department'
 
     att_policy_id = fields.Many2one('hr.attendance.policy', string='Attendance Policy')
+    att_rolling = fields.Boolean(string='Rolling Attendance Sheets',
+                                 help='The attendance sheets of the department are generated day by day '
+                                      'by a scheduled action, in a monthly rolling batch.')
 
 
 class HrContract(models.Model):
@@ -12,15 +12,53 @@
 ##############################################################################
 
 import pytz
-from datetime import timedelta
-from operator import itemgetter
-from odoo import api, fields, models, _
+from datetime import datetime, timedelta, time
+from odoo import api, fields, models, tools, _
 from odoo.addons.resource.models.resource import float_to_time
+from ..utils.intervals import IntervalSet
 
 
 class ResourceCalendar(models.Model):
     _inherit = "resource.calendar"
 
+    @tools.ormcache('self.id', 'self.write_date')
+    def _att_get_weekday_templates(self):
+        """ Return the calendar attendances of every weekday as a tuple of
+        seven tuples of (hour_from, hour_to, date_from, date_to). Kept until
+        the calendar or one of its attendances changes, which bumps the
+        write date of the calendar.
+        """
+        self.ensure_one()
+        templates = [[] for weekday in range(7)]
+        for att in self.attendance_ids:
+            templates[int(att.dayofweek)].append((att.hour_from, att.hour_to, att.date_from, att.date_to))
+        return tuple(tuple(template) for template in templates)
+
+    def att_get_work_intervals_by_day(self, date_from, date_to, tz):
+        """ Return the working intervals of every day between ``date_from``
+        and ``date_to`` as {date: ((utc_start, utc_stop), ...)}, the hours of
+        the calendar being expressed in the timezone ``tz``.
+        """
+        self.ensure_one()
+        templates = self._att_get_weekday_templates()
+        res = {}
+        day = date_from
+        while day <= date_to:
+            hours = [(hour_from, hour_to) for hour_from, hour_to, valid_from, valid_to in templates[day.weekday()]
+                     if not (valid_from and valid_from > day) and not (valid_to and valid_to < day)]
+            day_start = datetime.combine(day, time.min)
+            day_end = day_start.replace(hour=23, minute=59, second=59)
+            intervals = []
+            for hour_from, hour_to in hours:
+                dt_f = max(day_start + timedelta(seconds=hour_from * 3600), day_start)
+                dt_t = min(day_start + timedelta(seconds=hour_to * 3600), day_end)
+                intervals.append((
+                    tz.localize(dt_f).astimezone(pytz.utc).replace(tzinfo=None),
+                    tz.localize(dt_t).astimezone(pytz.utc).replace(tzinfo=None)))
+            res[day] = tuple(self.att_interval_clean(intervals))
+            day += timedelta(days=1)
+        return res
+
     def _get_day_attendances(self, day_date, start_time, end_time):
         self.ensure_one()
         weekday = day_date.weekday()
@@ -41,81 +79,44 @@ class ResourceCalendar(models.Model):
         return attendances
 
     def att_get_work_intervals(self, day_start, day_end):
-        tz_info = fields.Datetime.context_timestamp(self, day_start).tzinfo
-        day_start_utc = day_start.replace(tzinfo=tz_info)
-        day_end_utc = day_end.replace(tzinfo=tz_info)
-        att_work_intervals = self._attendance_intervals(day_start_utc,
-                                                        day_end_utc)
-        day_wrok_att = self._get_day_attendances(day_start.date(),
-                                                 day_start.replace(hour=0,
-                                                                   minute=0,
-                                                                   second=0).time(),
-                                                 day_end.time())
+        tz = pytz.timezone(self.env.context.get('tz') or self.env.user.tz or 'UTC')
+        day = day_start.date()
+        day_start_utc = tz.localize(day_start).astimezone(pytz.utc).replace(tzinfo=None)
+        day_end_utc = tz.localize(day_end).astimezone(pytz.utc).replace(tzinfo=None)
         working_intervals = []
-
-        for att in self._get_day_attendances(day_start.date(),
-                                             day_start.replace(hour=0, minute=0,
-                                                               second=0).time(),
-                                             day_end.time()):
-            dt_f = day_start.replace(hour=0, minute=0, second=0) + timedelta(
-                seconds=(att.hour_from * 3600))
-            if dt_f < day_start:
-                dt_f = day_start
-            dt_t = day_start.replace(hour=0, minute=0, second=0) + timedelta(
-                seconds=(att.hour_to * 3600))
-            if dt_t > day_end:
-                dt_t = day_end
-            working_interval = (dt_f, dt_t)
-            working_interval_tz = (
-                dt_f.replace(tzinfo=tz_info).astimezone(pytz.UTC).replace(
-                    tzinfo=None),
-                dt_t.replace(tzinfo=tz_info).astimezone(pytz.UTC).replace(
-                    tzinfo=None))
-            working_intervals.append(working_interval_tz)
-        clean_work_intervals = self.att_interval_clean(working_intervals)
-
-        return clean_work_intervals
+        for dt_f, dt_t in self.att_get_work_intervals_by_day(day, day, tz)[day]:
+            dt_f = max(dt_f, day_start_utc)
+            dt_t = min(dt_t, day_end_utc)
+            if dt_f < dt_t:
+                working_intervals.append((dt_f, dt_t))
+        return working_intervals
 
     def att_interval_clean(self, intervals):
-        intervals = sorted(intervals,
-                           key=itemgetter(0))  # sort on first datetime
-        cleaned = []
-        working_interval = None
-        while intervals:
-            current_interval = intervals.pop(0)
-            if not working_interval:  # init
-                working_interval = [current_interval[0], current_interval[1]]
-            elif working_interval[1] < current_interval[
-                0]:  # interval is disjoint
-                cleaned.append(tuple(working_interval))
-                working_interval = [current_interval[0], current_interval[1]]
-            elif working_interval[1] < current_interval[
-                1]:  # union of greater intervals
-                working_interval[1] = current_interval[1]
-        if working_interval:  # handle void lists
-            cleaned.append(tuple(working_interval))
-        return cleaned
+        return list(IntervalSet(intervals))
 
     def att_interval_without_leaves(self, interval, leave_intervals):
         if not interval:
             return interval
-        if leave_intervals is None:
-            leave_intervals = []
-        intervals = []
-        leave_intervals = self.att_interval_clean(leave_intervals)
-        current_interval = [interval[0], interval[1]]
-        for leave in leave_intervals:
-            if leave[1] <= current_interval[0]:
-                continue
-            if leave[0] >= current_interval[1]:
-                break
-            if current_interval[0] < leave[0] < current_interval[1]:
-                current_interval[1] = leave[0]
-                intervals.append((current_interval[0], current_interval[1]))
-                current_interval = [leave[1], interval[1]]
-            if current_interval[0] <= leave[1]:
-                current_interval[0] = leave[1]
-        if current_interval and current_interval[0] < interval[
-            1]:  # remove intervals moved outside base interval due to leaves
-            intervals.append((current_interval[0], current_interval[1]))
-        return intervals
+        return IntervalSet(leave_intervals or ()).subtract_interval(interval)
+
+
+class ResourceCalendarAttendance(models.Model):
+    _inherit = "resource.calendar.attendance"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attendances = super(ResourceCalendarAttendance, self).create(vals_list)
+        attendances.mapped('calendar_id').write({})
+        return attendances
+
+    def write(self, vals):
+        calendars = self.mapped('calendar_id')
+        res = super(ResourceCalendarAttendance, self).write(vals)
+        (calendars | self.mapped('calendar_id')).write({})
+        return res
+
+    def unlink(self):
+        calendars = self.mapped('calendar_id')
+        res = super(ResourceCalendarAttendance, self).unlink()
+        calendars.exists().write({})
+        return res
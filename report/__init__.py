@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+from . import attendance_sheet_report
+from . import attendance_sheet_summary
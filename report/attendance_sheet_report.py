@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+from odoo import models, api
+
+
+class ReportAttendanceSheet(models.AbstractModel):
+    _name = 'report.hr_geotagging.report_attendance_sheet'
+    _description = 'Attendance Sheet Report'
+
+    _line_fields = ['att_sheet_id', 'date', 'day', 'pl_sign_in', 'pl_sign_out', 'ac_sign_in',
+                    'ac_sign_out', 'worked_hours', 'late_in', 'overtime', 'diff_time', 'status', 'note']
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        """ Read the lines of all the printed sheets in one query, instead of
+        letting the template fetch them sheet by sheet. """
+        docs = self.env['attendance.sheet'].browse(docids)
+        Line = self.env['attendance.sheet.line']
+        days = dict(Line._fields['day']._description_selection(self.env))
+        statuses = dict(Line._fields['status']._description_selection(self.env))
+        lines = {}
+        for line in Line.search([('att_sheet_id', 'in', docs.ids)], order='att_sheet_id, id').read(
+                self._line_fields, load=None):
+            line['day'] = days.get(line['day'], '')
+            line['status'] = statuses.get(line['status'], '')
+            lines.setdefault(line['att_sheet_id'], []).append(line)
+        return {
+            'doc_ids': docs.ids,
+            'doc_model': 'attendance.sheet',
+            'docs': docs,
+            'lines': lines,
+        }
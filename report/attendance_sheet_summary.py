@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+import logging
+from datetime import timedelta
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+
+class AttendanceSheetSummary(models.Model):
+    """ Monthly totals of the attendance sheets, kept in a table refreshed
+    incrementally: a refresh only aggregates again the lines of the sheets
+    written since their rows were computed, and the rows of deleted sheets
+    go away with them. A row holds the totals of one sheet for one month, so
+    that dashboards group a few pre-aggregated rows by employee, department
+    or month instead of all the sheet lines.
+    """
+    _name = 'attendance.sheet.summary'
+    _description = 'Attendance Monthly Summary'
+    _auto = False
+    _rec_name = 'month'
+    _order = 'month desc, employee_id'
+
+    sheet_id = fields.Many2one('attendance.sheet', string='Attendance Sheet', readonly=True)
+    employee_id = fields.Many2one('hr.employee', string='Employee', readonly=True)
+    department_id = fields.Many2one('hr.department', string='Department', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    month = fields.Date(string='Month', readonly=True)
+    no_days = fields.Integer(string='No of Days', readonly=True)
+    worked_hours = fields.Float(string='Worked Hours', readonly=True)
+    tot_late = fields.Float(string='Total Late In', readonly=True)
+    no_late = fields.Integer(string='No of Lates', readonly=True)
+    tot_difftime = fields.Float(string='Total Diff time Hours', readonly=True)
+    no_difftime = fields.Integer(string='No of Diff Times', readonly=True)
+    tot_absence = fields.Float(string='Total absence Hours', readonly=True)
+    no_absence = fields.Integer(string='No of Absence Days', readonly=True)
+    tot_overtime = fields.Float(string='Total Over Time', readonly=True)
+    no_overtime = fields.Integer(string='No of overtimes', readonly=True)
+    sheet_write_date = fields.Datetime(string='Sheet Last Update', readonly=True)
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS attendance_sheet_summary (
+                id SERIAL PRIMARY KEY,
+                sheet_id INTEGER NOT NULL REFERENCES attendance_sheet(id) ON DELETE CASCADE,
+                employee_id INTEGER,
+                department_id INTEGER,
+                company_id INTEGER,
+                month DATE NOT NULL,
+                no_days INTEGER,
+                worked_hours DOUBLE PRECISION,
+                tot_late DOUBLE PRECISION,
+                no_late INTEGER,
+                tot_difftime DOUBLE PRECISION,
+                no_difftime INTEGER,
+                tot_absence DOUBLE PRECISION,
+                no_absence INTEGER,
+                tot_overtime DOUBLE PRECISION,
+                no_overtime INTEGER,
+                sheet_write_date TIMESTAMP
+            )
+        """)
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS attendance_sheet_summary_sheet_month_index
+                ON attendance_sheet_summary (sheet_id, month)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS attendance_sheet_summary_month_department_index
+                ON attendance_sheet_summary (month, department_id)
+        """)
+
+    @api.model
+    def _get_changed_sheet_ids(self):
+        """ Return the ids of the sheets without summary rows or written
+        since their rows were computed. """
+        self.env['attendance.sheet'].flush(['write_date'])
+        self.env.cr.execute("""
+            SELECT DISTINCT s.id
+              FROM attendance_sheet s
+         LEFT JOIN attendance_sheet_summary sm ON sm.sheet_id = s.id
+             WHERE sm.id IS NULL OR sm.sheet_write_date IS DISTINCT FROM s.write_date
+        """)
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _refresh_summary(self, sheet_ids=None):
+        """ Aggregate again the lines of the changed sheets, or of
+        ``sheet_ids`` when given, and return the number of refreshed sheets.
+        A refresh already running in another transaction is not waited for.
+        """
+        self.env.cr.execute("SELECT pg_try_advisory_xact_lock(hashtext('attendance_sheet_summary'))")
+        if not self.env.cr.fetchone()[0]:
+            _logger.info("Attendance summary refresh skipped: another refresh is running")
+            return 0
+        if sheet_ids is None:
+            sheet_ids = self._get_changed_sheet_ids()
+        if not sheet_ids:
+            return 0
+        self.env['attendance.sheet.line'].flush(['att_sheet_id', 'date', 'worked_hours', 'late_in',
+                                                 'diff_time', 'overtime', 'status'])
+        self.env.cr.execute("DELETE FROM attendance_sheet_summary WHERE sheet_id = ANY(%s)", (list(sheet_ids),))
+        self.env.cr.execute("""
+            INSERT INTO attendance_sheet_summary (
+                sheet_id, employee_id, department_id, company_id, month, no_days, worked_hours,
+                tot_late, no_late, tot_difftime, no_difftime, tot_absence, no_absence,
+                tot_overtime, no_overtime, sheet_write_date)
+            SELECT s.id, s.employee_id, e.department_id, e.company_id,
+                   date_trunc('month', COALESCE(l.date, s.date_from))::date AS month,
+                   COUNT(l.id),
+                   COALESCE(SUM(l.worked_hours), 0),
+                   COALESCE(SUM(l.late_in) FILTER (WHERE l.late_in > 0), 0),
+                   COUNT(l.id) FILTER (WHERE l.late_in > 0),
+                   COALESCE(SUM(l.diff_time) FILTER (
+                       WHERE l.diff_time > 0 AND l.status IS DISTINCT FROM 'ab'), 0),
+                   COUNT(l.id) FILTER (WHERE l.diff_time > 0 AND l.status IS DISTINCT FROM 'ab'),
+                   COALESCE(SUM(l.diff_time) FILTER (WHERE l.diff_time > 0 AND l.status = 'ab'), 0),
+                   COUNT(l.id) FILTER (WHERE l.diff_time > 0 AND l.status = 'ab'),
+                   COALESCE(SUM(l.overtime) FILTER (WHERE l.overtime > 0), 0),
+                   COUNT(l.id) FILTER (WHERE l.overtime > 0),
+                   s.write_date
+              FROM attendance_sheet s
+              JOIN hr_employee e ON e.id = s.employee_id
+         LEFT JOIN attendance_sheet_line l ON l.att_sheet_id = s.id
+             WHERE s.id = ANY(%s)
+          GROUP BY s.id, e.id, 5
+        """, (list(sheet_ids),))
+        self.invalidate_cache()
+        return len(sheet_ids)
+
+    @api.model
+    def _cron_refresh(self):
+        count = self._refresh_summary()
+        _logger.info("Attendance summary refreshed for %s sheets", count)
+
+    @api.model
+    def _is_stale(self):
+        """ Return whether the scheduled refresh did not run for more than
+        ``hr_geotagging.summary_max_age`` minutes (2 hours by default). """
+        max_age = int(self.env['ir.config_parameter'].sudo().get_param(
+            'hr_geotagging.summary_max_age', 120))
+        cron = self.env.ref('hr_geotagging.ir_cron_refresh_attendance_summary', raise_if_not_found=False)
+        if not cron or not cron.sudo().active or not cron.sudo().lastcall:
+            return True
+        return cron.sudo().lastcall < fields.Datetime.now() - timedelta(minutes=max_age)
+
+    @api.model
+    def action_open_summary(self):
+        """ Open the summary, refreshing it first only when the scheduled
+        refresh is late. """
+        if self._is_stale():
+            self._refresh_summary()
+        return self.env.ref('hr_geotagging.action_attendance_sheet_summary').read()[0]
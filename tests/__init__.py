@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+from . import test_engine
+from . import test_intervals
+from . import test_punches
+from . import test_attendance_sheet
+from . import test_att_sheet_batch
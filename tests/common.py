@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+from datetime import date, timedelta
+
+from odoo.tests.common import TransactionCase
+
+
+class AttendanceSheetCase(TransactionCase):
+    """ Working hours of 8-12 and 13-17 from Monday to Friday in UTC, an
+    attendance policy without penalties and a helper creating employees
+    under contract with both. """
+
+    def setUp(self):
+        super(AttendanceSheetCase, self).setUp()
+        self.calendar = self.env['resource.calendar'].create({
+            'name': 'Attendance Sheet Test Hours',
+            'tz': 'UTC',
+            'company_id': False,
+        })
+        self.policy = self.env['hr.attendance.policy'].create({
+            'name': 'Attendance Sheet Test Policy',
+            'late_rule_id': self.env['hr.late.rule'].create({'name': 'No Late Penalty'}).id,
+            'absence_rule_id': self.env['hr.absence.rule'].create({'name': 'No Absence Penalty'}).id,
+            'diff_rule_id': self.env['hr.diff.rule'].create({'name': 'No Difference Penalty'}).id,
+        })
+        self.structure = self.env.ref('hr_geotagging.structure_attendance_sheet')
+        self.contract_start = date(2019, 1, 1)
+
+    def create_employee(self, name, department=None, company=None, contract=True):
+        company = company or self.env.company
+        employee = self.env['hr.employee'].create({
+            'name': name,
+            'tz': 'UTC',
+            'company_id': company.id,
+            'department_id': department.id if department else False,
+            'resource_calendar_id': self.calendar.id,
+        })
+        if contract:
+            employee.contract_id = self.create_contract(employee, self.contract_start)
+        return employee
+
+    def create_contract(self, employee, date_start, date_end=False):
+        return self.env['hr.contract'].create({
+            'name': 'Contract of %s' % employee.name,
+            'employee_id': employee.id,
+            'company_id': employee.company_id.id,
+            'wage': 1000,
+            'date_start': date_start,
+            'date_end': date_end,
+            'state': 'open',
+            'resource_calendar_id': self.calendar.id,
+            'struct_id': self.structure.id,
+            'att_policy_id': self.policy.id,
+        })
+
+    def create_sheet(self, employee, date_from, date_to, batch=None):
+        return self.env['attendance.sheet'].create({
+            'name': 'Attendance Sheet of %s' % employee.name,
+            'employee_id': employee.id,
+            'date_from': date_from,
+            'date_to': date_to,
+            'att_policy_id': self.policy.id,
+            'batch_id': batch.id if batch else False,
+        })
+
+    @staticmethod
+    def days(date_from, date_to):
+        return {date_from + timedelta(days=x) for x in range((date_to - date_from).days + 1)}
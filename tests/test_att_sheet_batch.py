@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import AttendanceSheetCase
+
+
+@tagged('post_install', '-at_install')
+class TestRollingBatch(AttendanceSheetCase):
+    """ Rolling batches append the days up to the previous one to their
+    sheets, catching up the days missed by the scheduled action. """
+
+    def setUp(self):
+        super(TestRollingBatch, self).setUp()
+        self.department = self.env['hr.department'].create({
+            'name': 'Rolling Department',
+            'att_policy_id': self.policy.id,
+        })
+        self.employee = self.create_employee('Rolling Employee', self.department)
+        self.batch_obj = self.env['attendance.sheet.batch']
+
+    def create_batch(self, date_from, date_to, **vals):
+        vals.update({
+            'name': 'Rolling Batch',
+            'department_id': self.department.id,
+            'date_from': date_from,
+            'date_to': date_to,
+            'rolling': True,
+        })
+        batch = self.batch_obj.create(vals)
+        self.create_sheet(self.employee, date_from, date_to, batch)
+        return batch
+
+    def line_dates(self, batch):
+        return set(batch.att_sheet_ids.mapped('att_sheet_line_ids.date'))
+
+    def test_roll_days(self):
+        batch = self.create_batch(date(2020, 1, 1), date(2020, 1, 31))
+        batch._roll_att_sheets(date(2020, 1, 5))
+        self.assertEqual(batch.rolled_to, date(2020, 1, 5))
+        self.assertEqual(self.line_dates(batch), self.days(date(2020, 1, 1), date(2020, 1, 5)))
+
+        # the following days only are appended, the earlier ones are kept
+        lines = batch.att_sheet_ids.mapped('att_sheet_line_ids')
+        batch._roll_att_sheets(date(2020, 1, 9))
+        self.assertEqual(self.line_dates(batch), self.days(date(2020, 1, 1), date(2020, 1, 9)))
+        self.assertTrue(lines <= batch.att_sheet_ids.mapped('att_sheet_line_ids'))
+        self.assertEqual(batch.state, 'draft')
+
+        # the batch is generated once its last day is reached
+        batch._roll_att_sheets(date(2020, 2, 3))
+        self.assertEqual(batch.rolled_to, date(2020, 1, 31))
+        self.assertEqual(self.line_dates(batch), self.days(date(2020, 1, 1), date(2020, 1, 31)))
+        self.assertEqual(batch.state, 'att_gen')
+
+    def test_cron_catch_up(self):
+        # the scheduled action stopped a few days into the previous month
+        today = fields.Date.context_today(self.batch_obj)
+        date_from = today.replace(day=1) - relativedelta(months=1)
+        date_to = today.replace(day=1) - timedelta(days=1)
+        batch = self.create_batch(date_from, date_to, rolled_to=date_from + timedelta(days=4))
+        self.batch_obj._cron_roll_att_sheets()
+        self.assertEqual(batch.rolled_to, date_to)
+        self.assertEqual(self.line_dates(batch), self.days(date_from + timedelta(days=5), date_to))
+        self.assertEqual(batch.state, 'att_gen')
+
+    def test_cron_covered_by_company_batch(self):
+        self.department.att_rolling = True
+        today = fields.Date.context_today(self.batch_obj)
+        date_from = today.replace(day=1)
+        if today == date_from:
+            date_from -= relativedelta(months=1)
+        self.batch_obj.create({
+            'name': 'Company Batch',
+            'scope': 'company',
+            'company_id': self.department.company_id.id,
+            'date_from': date_from,
+            'date_to': date_from + relativedelta(months=1, days=-1),
+        })
+        self.batch_obj._cron_roll_att_sheets()
+        self.assertFalse(self.batch_obj.search([('rolling', '=', True),
+                                                ('department_id', '=', self.department.id)]))
+
+
+@tagged('post_install', '-at_install')
+class TestBatchShards(AttendanceSheetCase):
+    """ Batches of a company are split by department into shards of
+    ``chunk_size`` employees, the employees without a department included. """
+
+    def setUp(self):
+        super(TestBatchShards, self).setUp()
+        self.company = self.env['res.company'].create({'name': 'Sharded Company'})
+        self.departments = self.env['hr.department']
+        self.employees = self.env['hr.employee']
+        for name, count in (('Sales', 3), ('Support', 1)):
+            department = self.env['hr.department'].create({'name': name, 'company_id': self.company.id})
+            self.departments |= department
+            for i in range(count):
+                self.employees |= self.create_employee('%s Employee %s' % (name, i), department,
+                                                       self.company, contract=False)
+        self.employees |= self.create_employee('Employee Without Department', company=self.company,
+                                               contract=False)
+        self.batch = self.env['attendance.sheet.batch'].create({
+            'name': 'Company Batch',
+            'scope': 'company',
+            'company_id': self.company.id,
+            'date_from': date(2020, 1, 1),
+            'date_to': date(2020, 1, 31),
+            'chunk_size': 2,
+        })
+
+    def test_shards(self):
+        self.batch._gen_att_sheet_chunks()
+        chunks = self.batch.chunk_ids
+        self.assertEqual(set(chunks.mapped('state')), {'pending'})
+        self.assertEqual(chunks.mapped('employee_ids'), self.employees)
+        self.assertEqual(sorted(chunks.mapped('sequence')), list(range(len(chunks))))
+        for chunk in chunks:
+            self.assertLessEqual(chunk.employee_count, 2)
+            self.assertEqual(chunk.employee_ids.mapped('department_id'), chunk.department_id)
+        self.assertEqual(len(chunks.filtered(lambda chunk: chunk.department_id == self.departments[0])), 2)
+        self.assertEqual(len(chunks.filtered(lambda chunk: not chunk.department_id)), 1)
+
+    def test_shards_new_employees(self):
+        self.batch._gen_att_sheet_chunks()
+        chunks = self.batch.chunk_ids
+        chunks.write({'state': 'done'})
+        employee = self.create_employee('Newcomer', self.departments[1], self.company, contract=False)
+        # generating again only queues the employees missing from the shards
+        self.batch._gen_att_sheet_chunks()
+        new_chunks = self.batch.chunk_ids - chunks
+        self.assertEqual(new_chunks.employee_ids, employee)
+        self.assertEqual(new_chunks.state, 'pending')
+        self.assertGreater(new_chunks.sequence, max(chunks.mapped('sequence')))
+        self.assertEqual(set(chunks.mapped('state')), {'done'})
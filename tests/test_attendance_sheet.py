@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+from datetime import date
+
+from odoo.tests import tagged
+
+from .common import AttendanceSheetCase
+
+
+@tagged('post_install', '-at_install')
+class TestCreatePayslips(AttendanceSheetCase):
+    """ The payslips of many sheets are created at once, one per sheet, on
+    the latest contract of the period. """
+
+    def setUp(self):
+        super(TestCreatePayslips, self).setUp()
+        self.date_from = date(2020, 1, 1)
+        self.date_to = date(2020, 1, 31)
+        self.payslip_run = self.env['hr.payslip.run'].create({
+            'name': 'January 2020',
+            'date_start': self.date_from,
+            'date_end': self.date_to,
+        })
+        self.batch = self.env['attendance.sheet.batch'].create({
+            'name': 'January 2020',
+            'department_id': self.env['hr.department'].create({'name': 'Payroll Department'}).id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'payslip_batch_id': self.payslip_run.id,
+        })
+
+    def test_create_payslips(self):
+        employees = [self.create_employee('Paid Employee %s' % i) for i in range(3)]
+        sheets = self.env['attendance.sheet']
+        for employee in employees:
+            sheets |= self.create_sheet(employee, self.date_from, self.date_to, self.batch)
+        payslips = sheets.create_payslip()
+        self.assertEqual(len(payslips), 3)
+        for sheet in sheets:
+            self.assertTrue(sheet.payslip_id)
+            self.assertEqual(sheet.payslip_id.employee_id, sheet.employee_id)
+            self.assertEqual(sheet.payslip_id.payslip_run_id, self.payslip_run)
+            self.assertIn('OVT', sheet.payslip_id.worked_days_line_ids.mapped('code'))
+        # the sheets having a payslip are skipped
+        self.assertFalse(sheets.create_payslip())
+
+    def test_latest_contract(self):
+        employee = self.create_employee('Promoted Employee', contract=False)
+        self.create_contract(employee, self.contract_start, date(2020, 1, 15))
+        latest = self.create_contract(employee, date(2020, 1, 16))
+        sheet = self.create_sheet(employee, self.date_from, self.date_to, self.batch)
+        sheet.create_payslip()
+        self.assertEqual(sheet.payslip_id.contract_id, latest)
+
+
+@tagged('post_install', '-at_install')
+class TestExportLines(AttendanceSheetCase):
+    """ The export reads the lines by pages and yields every line once, in
+    the order of the sheets and lines. """
+
+    def test_export_pages(self):
+        line_obj = self.env['attendance.sheet.line']
+        sheets = self.env['attendance.sheet']
+        for i in range(3):
+            employee = self.create_employee('Exported Employee %s' % i)
+            sheet = self.create_sheet(employee, date(2020, 1, 1), date(2020, 1, 31))
+            line_obj.create([{
+                'att_sheet_id': sheet.id,
+                'date': date(2020, 1, day),
+                'day': str(date(2020, 1, day).weekday()),
+                'worked_hours': day,
+            } for day in range(1, 6)])
+            sheets |= sheet
+        expected = [
+            (sheet.employee_id.name, date(2020, 1, day), float(day))
+            for sheet in sheets.sorted('id') for day in range(1, 6)
+        ]
+        worked_hours_index = 4 + line_obj._export_fields.index('worked_hours')
+        date_index = 4 + line_obj._export_fields.index('date')
+        # pages smaller than, dividing and larger than the number of lines
+        for chunk_size in (1, 2, 5, 1000):
+            rows = list(line_obj._iter_export_rows(sheets.ids, chunk_size=chunk_size))
+            self.assertEqual([(row[0], row[date_index], row[worked_hours_index]) for row in rows], expected)
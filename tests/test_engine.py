@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+import random
+import unittest
+from datetime import date, datetime, time, timedelta
+
+import pytz
+
+from ..utils.engine import AttendanceEngine, DayInput
+from ..utils.intervals import merge_intervals
+from ..utils.np_engine import SheetInput, VectorizedAttendanceEngine, np
+from ..utils.policy import PolicyEvaluator
+
+TIMEZONES = ['UTC', 'Africa/Cairo', 'America/New_York', 'Asia/Kolkata', 'Europe/London']
+
+
+def random_policy(rnd):
+    def time_lines():
+        return [(rnd.choice([0, 0.25, 0.5, 1]), rnd.choice(['rate', 'fix']), rnd.random() * 2, rnd.random())
+                for i in range(rnd.randint(0, 3))]
+    overtime = {}
+    for key in ('wd', 'we', 'ph'):
+        if rnd.random() < 0.7:
+            overtime[key + '_rate'] = rnd.choice([1, 1.5, 2])
+            overtime[key + '_after'] = rnd.choice([0, 0.5, 1])
+    absence_lines = [(rnd.randint(1, 5), rnd.random()) for i in range(rnd.randint(0, 3))]
+    return PolicyEvaluator(overtime, time_lines(), time_lines(), absence_lines)
+
+
+def random_day(rnd, tz, day, degenerate):
+    """ Return a DayInput of sorted disjoint work intervals and sorted
+    punches, or with ``degenerate`` zero length, touching or unsorted ones.
+    """
+    base = tz.localize(datetime.combine(day, time.min)).astimezone(pytz.utc).replace(tzinfo=None)
+
+    def at(minutes):
+        return base + timedelta(minutes=minutes, seconds=rnd.choice([0, 0, 7]))
+
+    work_intervals = []
+    if rnd.random() < 0.85:
+        current = rnd.choice([0, 300, 480])
+        for i in range(rnd.randint(1, 3)):
+            start = current + rnd.randint(0 if degenerate else 1, 120)
+            stop = start + (rnd.choice([0, rnd.randint(30, 300)]) if degenerate else rnd.randint(30, 300))
+            work_intervals.append((at(start), at(stop)))
+            current = stop
+    punches = []
+    current = rnd.randint(0, 600)
+    for i in range(rnd.randint(0, 6)):
+        start = current + rnd.randint(0, 180)
+        stop = start + (rnd.choice([0, rnd.randint(1, 400)]) if degenerate else rnd.randint(1, 400))
+        punches.append((at(start), at(stop)))
+        current = stop
+    if degenerate and rnd.random() < 0.2:
+        rnd.shuffle(punches)
+    return DayInput(day, tuple(sorted(work_intervals)), tuple(punches), rnd.random() < 0.15)
+
+
+def random_sheet(rnd, degenerate=False):
+    tz = pytz.timezone(rnd.choice(TIMEZONES))
+    first_day = date(2024, rnd.randint(1, 12), 1)
+    days = [random_day(rnd, tz, first_day + timedelta(days=i), degenerate and rnd.random() < 0.5)
+            for i in range(rnd.randint(1, 10))]
+    leaves = []
+    if rnd.random() < 0.5:
+        base = datetime.combine(first_day, time.min)
+        for i in range(rnd.randint(1, 4)):
+            start = rnd.randint(-1000, 14000)
+            leaves.append((base + timedelta(minutes=start), base + timedelta(minutes=start + rnd.randint(10, 900))))
+    return SheetInput(random_policy(rnd), tz, days, merge_intervals(leaves))
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestVectorizedEngine(unittest.TestCase):
+    """ The vectorized engine gives the lines of the scalar engine. """
+
+    def assertSameLines(self, sheets):
+        results = VectorizedAttendanceEngine().compute_sheets(sheets)
+        self.assertEqual(len(results), len(sheets))
+        for sheet, lines in zip(sheets, results):
+            expected = AttendanceEngine(sheet.policy, sheet.tz).compute_sheet(sheet.days, sheet.leaves)
+            self.assertEqual(lines, expected)
+
+    def test_random_sheets(self):
+        rnd = random.Random(0)
+        for i in range(300):
+            self.assertSameLines([random_sheet(rnd) for j in range(rnd.randint(1, 6))])
+
+    def test_random_degenerate_sheets(self):
+        rnd = random.Random(1)
+        for i in range(300):
+            self.assertSameLines([random_sheet(rnd, degenerate=True) for j in range(rnd.randint(1, 6))])
+
+    def test_zero_length_punch(self):
+        tz = pytz.utc
+        day = date(2024, 3, 4)
+        work = ((datetime(2024, 3, 4, 8), datetime(2024, 3, 4, 16)),)
+        punch = (datetime(2024, 3, 4, 9), datetime(2024, 3, 4, 9))
+        sheet = SheetInput(PolicyEvaluator({}), tz, [DayInput(day, work, (punch,), False)], [])
+        lines = VectorizedAttendanceEngine().compute_sheets([sheet])[0]
+        self.assertEqual(lines, AttendanceEngine(sheet.policy, tz).compute_sheet(sheet.days))
+        self.assertEqual([line.get('status') for line in lines], ['ab', None])
+
+    def test_empty(self):
+        self.assertEqual(VectorizedAttendanceEngine().compute_sheets([]), [])
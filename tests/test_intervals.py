@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+import random
+import unittest
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from ..utils.intervals import IntervalSet
+
+
+# verbatim copies of the helpers of resource.calendar that IntervalSet replaced
+
+def att_interval_clean(intervals):
+    intervals = sorted(intervals,
+                       key=itemgetter(0))  # sort on first datetime
+    cleaned = []
+    working_interval = None
+    while intervals:
+        current_interval = intervals.pop(0)
+        if not working_interval:  # init
+            working_interval = [current_interval[0], current_interval[1]]
+        elif working_interval[1] < current_interval[
+            0]:  # interval is disjoint
+            cleaned.append(tuple(working_interval))
+            working_interval = [current_interval[0], current_interval[1]]
+        elif working_interval[1] < current_interval[
+            1]:  # union of greater intervals
+            working_interval[1] = current_interval[1]
+    if working_interval:  # handle void lists
+        cleaned.append(tuple(working_interval))
+    return cleaned
+
+
+def att_interval_without_leaves(interval, leave_intervals):
+    if not interval:
+        return interval
+    if leave_intervals is None:
+        leave_intervals = []
+    intervals = []
+    leave_intervals = att_interval_clean(leave_intervals)
+    current_interval = [interval[0], interval[1]]
+    for leave in leave_intervals:
+        if leave[1] <= current_interval[0]:
+            continue
+        if leave[0] >= current_interval[1]:
+            break
+        if current_interval[0] < leave[0] < current_interval[1]:
+            current_interval[1] = leave[0]
+            intervals.append((current_interval[0], current_interval[1]))
+            current_interval = [leave[1], interval[1]]
+        if current_interval[0] <= leave[1]:
+            current_interval[0] = leave[1]
+    if current_interval and current_interval[0] < interval[
+        1]:  # remove intervals moved outside base interval due to leaves
+        intervals.append((current_interval[0], current_interval[1]))
+    return intervals
+
+
+def difference_with_old_helpers(intervals, others):
+    res = []
+    for interval in att_interval_clean(intervals):
+        res += att_interval_without_leaves(interval, others)
+    return att_interval_clean(res)
+
+
+class TestIntervalSet(unittest.TestCase):
+    """ IntervalSet gives the results of the former resource.calendar
+    helpers on random inputs, integers and datetimes. """
+
+    def setUp(self):
+        self.rnd = random.Random(7)
+        self.base = datetime(2021, 1, 1)
+
+    def random_intervals(self, count, as_datetime, proper_only=True):
+        res = []
+        for i in range(self.rnd.randint(0, count)):
+            start = self.rnd.randint(0, 50)
+            stop = start + self.rnd.randint(0 if proper_only else -3, 10)
+            if as_datetime:
+                res.append((self.base + timedelta(hours=start), self.base + timedelta(hours=stop)))
+            else:
+                res.append((start, stop))
+        return res
+
+    def cells(self, intervals):
+        return {cell for start, stop in intervals for cell in range(start, stop)}
+
+    def test_clean(self):
+        for i in range(3000):
+            intervals = self.random_intervals(8, i % 2, proper_only=i % 5 != 0)
+            self.assertEqual(list(IntervalSet(intervals)), att_interval_clean(intervals))
+
+    def test_subtract_interval(self):
+        for i in range(3000):
+            leaves = self.random_intervals(8, i % 2)
+            interval = self.random_intervals(1, i % 2, proper_only=i % 5 != 0)
+            if not interval:
+                continue
+            self.assertEqual(IntervalSet(leaves).subtract_interval(interval[0]),
+                             att_interval_without_leaves(interval[0], leaves))
+
+    def test_union(self):
+        for i in range(3000):
+            left = self.random_intervals(6, i % 2)
+            right = self.random_intervals(6, i % 2)
+            self.assertEqual(list(IntervalSet(left) | IntervalSet(right)), att_interval_clean(left + right))
+
+    def test_difference(self):
+        for i in range(3000):
+            left = self.random_intervals(6, i % 2)
+            right = self.random_intervals(6, i % 2)
+            self.assertEqual(list(IntervalSet(left) - IntervalSet(right)),
+                             difference_with_old_helpers(left, right))
+
+    def test_intersection(self):
+        for i in range(3000):
+            left = self.random_intervals(6, i % 2)
+            right = self.random_intervals(6, i % 2)
+            expected = difference_with_old_helpers(left, difference_with_old_helpers(left, right))
+            self.assertEqual(list(IntervalSet(left) & IntervalSet(right)), expected)
+
+    def test_algebra_on_cells(self):
+        for i in range(3000):
+            left = IntervalSet(self.random_intervals(6, False))
+            right = IntervalSet(self.random_intervals(6, False))
+            self.assertEqual(self.cells(left | right), self.cells(left) | self.cells(right))
+            self.assertEqual(self.cells(left & right), self.cells(left) & self.cells(right))
+            self.assertEqual(self.cells(left - right), self.cells(left) - self.cells(right))
+            self.assertEqual(left | right, right | left)
+            self.assertEqual(left & right, right & left)
+            self.assertEqual((left - right).duration(0), len(self.cells(left - right)))
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            IntervalSet().foo = 1
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+
+from datetime import date, datetime
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import AttendanceSheetCase
+
+
+@tagged('post_install', '-at_install')
+class TestIngestPunches(AttendanceSheetCase):
+    """ Device punches are paired per employee, recorded once per key and
+    an employee whose punches break the batch does not lose the others. """
+
+    def setUp(self):
+        super(TestIngestPunches, self).setUp()
+        self.employee = self.create_employee('Punching Employee')
+        self.other = self.create_employee('Other Punching Employee')
+        self.attendance_obj = self.env['hr.attendance']
+        self.pending_obj = self.env['attendance.sheet.pending.day']
+
+    def punch(self, key, employee, timestamp, punch_type=None):
+        item = {'key': key, 'employee_id': employee.id, 'timestamp': timestamp}
+        if punch_type:
+            item['type'] = punch_type
+        return item
+
+    def test_pairing(self):
+        results = self.attendance_obj.ingest_punches([
+            self.punch('k2', self.employee, '2020-01-06 17:00:00'),
+            self.punch('k1', self.employee, '2020-01-06 08:00:00'),
+            self.punch('k3', self.employee, '2020-01-07 08:00:00'),
+            self.punch('k4', self.other, '2020-01-06 09:00:00', 'check_out'),
+        ])
+        self.assertEqual([res['status'] for res in results], ['closed', 'created', 'created', 'error'])
+        closed = self.attendance_obj.browse(results[0]['attendance_id'])
+        self.assertEqual(closed, self.attendance_obj.browse(results[1]['attendance_id']))
+        self.assertEqual((closed.check_in, closed.check_out),
+                         (datetime(2020, 1, 6, 8), datetime(2020, 1, 6, 17)))
+        self.assertEqual((closed.check_in_key, closed.check_out_key), ('k1', 'k2'))
+        opened = self.attendance_obj.browse(results[2]['attendance_id'])
+        self.assertFalse(opened.check_out)
+
+        # the punch closing the open attendance comes in a later batch
+        results = self.attendance_obj.ingest_punches([
+            self.punch('k5', self.employee, '2020-01-07 17:00:00'),
+        ])
+        self.assertEqual(results[0]['status'], 'closed')
+        self.assertEqual(results[0]['attendance_id'], opened.id)
+        self.assertEqual(opened.check_out, datetime(2020, 1, 7, 17))
+
+    def test_dedup(self):
+        items = [
+            self.punch('k1', self.employee, '2020-01-06 08:00:00'),
+            self.punch('k2', self.employee, '2020-01-06 17:00:00'),
+        ]
+        results = self.attendance_obj.ingest_punches(items + [items[0]])
+        self.assertEqual([res['status'] for res in results], ['created', 'closed', 'duplicate'])
+        attendance_id = results[0]['attendance_id']
+
+        # a device sending the same punches again, on the check in and
+        # check out keys both
+        results = self.attendance_obj.ingest_punches(items)
+        self.assertEqual([(res['status'], res['attendance_id']) for res in results],
+                         [('duplicate', attendance_id), ('duplicate', attendance_id)])
+        self.assertEqual(self.attendance_obj.search_count([('employee_id', '=', self.employee.id)]), 1)
+
+    def test_fallback_per_employee(self):
+        self.attendance_obj.create({
+            'employee_id': self.other.id,
+            'check_in': datetime(2020, 1, 6, 8),
+            'check_out': datetime(2020, 1, 6, 17),
+        })
+        # the punch of the other employee overlaps its attendance and fails
+        # the multi-create, the punches of the employee are recorded alone
+        results = self.attendance_obj.ingest_punches([
+            self.punch('k1', self.employee, '2020-01-06 08:00:00'),
+            self.punch('k2', self.other, '2020-01-06 10:00:00', 'check_in'),
+            self.punch('k3', self.employee, '2020-01-06 17:00:00'),
+        ])
+        self.assertEqual([res['status'] for res in results], ['created', 'error', 'closed'])
+        self.assertTrue(results[1]['message'])
+        attendance = self.attendance_obj.browse(results[0]['attendance_id'])
+        self.assertEqual((attendance.check_in_key, attendance.check_out_key), ('k1', 'k3'))
+        self.assertFalse(self.attendance_obj.search([('check_in_key', '=', 'k2')]))
+
+    def test_queue_days(self):
+        self.attendance_obj.ingest_punches([
+            self.punch('k1', self.employee, '2020-01-06 08:00:00'),
+            self.punch('k2', self.employee, '2020-01-06 17:00:00'),
+        ])
+        pending = self.pending_obj.search([('employee_id', '=', self.employee.id)])
+        self.assertEqual(pending.mapped('date'), [date(2020, 1, 6)])
+
+
+@tagged('post_install', '-at_install')
+class TestRecomputeQueue(AttendanceSheetCase):
+    """ Punches only queue the days of their sheets, which the scheduled
+    action recomputes afterwards. """
+
+    def setUp(self):
+        super(TestRecomputeQueue, self).setUp()
+        self.employee = self.create_employee('Late Punching Employee')
+        self.sheet = self.create_sheet(self.employee, date(2020, 1, 1), date(2020, 1, 31))
+        self.sheet.get_attendances()
+        self.pending_obj = self.env['attendance.sheet.pending.day']
+
+    def day_lines(self, day):
+        return self.sheet.att_sheet_line_ids.filtered(lambda line: line.date == day)
+
+    def run_queue(self):
+        with patch.object(self.env.cr, 'commit', lambda: None):
+            self.pending_obj._cron_recompute_days()
+
+    def test_recompute_queued_days(self):
+        day = date(2020, 1, 6)
+        self.assertEqual(set(self.day_lines(day).mapped('status')), {'ab'})
+        self.env['hr.attendance'].create({
+            'employee_id': self.employee.id,
+            'check_in': datetime(2020, 1, 6, 8),
+            'check_out': datetime(2020, 1, 6, 17),
+        })
+        # the punch transaction leaves the sheet alone
+        self.assertEqual(self.pending_obj.search([('employee_id', '=', self.employee.id)]).mapped('date'), [day])
+        self.assertEqual(set(self.day_lines(day).mapped('status')), {'ab'})
+
+        self.run_queue()
+        self.sheet.invalidate_cache()
+        self.assertFalse(self.pending_obj.search([('employee_id', '=', self.employee.id)]))
+        lines = self.day_lines(day)
+        self.assertNotIn('ab', lines.mapped('status'))
+        self.assertTrue(any(lines.mapped('worked_hours')))
+
+    def test_no_recompute_context(self):
+        self.env['hr.attendance'].with_context(att_sheet_no_recompute=True).create({
+            'employee_id': self.employee.id,
+            'check_in': datetime(2020, 1, 7, 8),
+            'check_out': datetime(2020, 1, 7, 17),
+        })
+        self.assertFalse(self.pending_obj.search([('employee_id', '=', self.employee.id)]))
+
+    def test_sheet_without_lines(self):
+        employee = self.create_employee('New Employee')
+        sheet = self.create_sheet(employee, date(2020, 1, 1), date(2020, 1, 31))
+        self.env['hr.attendance'].create({
+            'employee_id': employee.id,
+            'check_in': datetime(2020, 1, 6, 8),
+            'check_out': datetime(2020, 1, 6, 17),
+        })
+        self.run_queue()
+        # the lines of a sheet not generated yet are left to its generation
+        self.assertFalse(sheet.att_sheet_line_ids)
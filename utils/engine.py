@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+import pytz
+from collections import namedtuple
+from datetime import datetime, timedelta, time
+
+from .intervals import IntervalSet
+from .tz import OffsetTable
+
+DEFAULT_NOTES = {
+    'ph': "working on Public Holiday",
+    'out': "overtime out of work intervals",
+    'weekend': "working in weekend",
+}
+
+# the inputs of one day of a sheet, all datetimes being naive UTC
+DayInput = namedtuple('DayInput', ['date', 'work_intervals', 'punches', 'holiday'])
+
+
+def float_from_time(value):
+    """ Return the hours of ``value`` as a float, ignoring the seconds. """
+    return value.hour + value.minute / 60.0
+
+
+class AttendanceEngine(object):
+    """ Computes attendance sheet lines from plain inputs, without any ORM
+    access: work intervals and punches as (start, stop) tuples, the merged
+    leaves of the employee and a compiled policy evaluator.
+
+    The engine only holds its configuration; the lines it returns are the
+    values of ``attendance.sheet.line`` records, without ``att_sheet_id``.
+    Local times are computed with ``offsets``, the OffsetTable of ``tz``
+    for the computed period, or of the whole timezone when not given.
+    """
+    __slots__ = ('policy', 'tz', 'notes', 'overtime', 'offsets')
+
+    def __init__(self, policy, tz, notes=None, offsets=None):
+        self.policy = policy
+        self.tz = tz
+        self.notes = dict(DEFAULT_NOTES, **(notes or {}))
+        self.overtime = policy.get_overtime()
+        self.offsets = offsets or OffsetTable(tz)
+
+    def _to_float(self, value):
+        return self.offsets.to_float(value)
+
+    def _day_bounds(self, day):
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start.replace(hour=23, minute=59, second=59)
+        return (self.tz.localize(day_start).astimezone(pytz.utc).replace(tzinfo=None),
+                self.tz.localize(day_end).astimezone(pytz.utc).replace(tzinfo=None))
+
+    def compute_sheet(self, days, leaves=(), abs_cnt=0):
+        """ Compute the lines of a sheet.
+
+        :param days: iterable of DayInput, in chronological order
+        :param leaves: IntervalSet or (start, stop) leaves of the employee
+        :param abs_cnt: number of absence days of the sheet before ``days``
+        :return: list of line values
+        """
+        if not isinstance(leaves, IntervalSet):
+            leaves = IntervalSet(leaves)
+        lines = []
+        for day_input in days:
+            day_lines, abs_cnt = self.compute_day(day_input, leaves, abs_cnt)
+            lines += day_lines
+        return lines
+
+    def compute_day(self, day_input, leave_set, abs_cnt=0):
+        """ Compute the lines of one day.
+
+        :param leave_set: IntervalSet of the leaves of the employee
+        :param abs_cnt: number of absence days before that day in the sheet
+        :return: (list of line values, updated absence counter)
+        """
+        day = day_input.date
+        work_intervals = list(day_input.work_intervals)
+        attendance_intervals = list(day_input.punches)
+        day_str = str(day.weekday())
+        date = day.strftime('%Y-%m-%d')
+        leaves = leave_set.touches(*self._day_bounds(day))
+        if not work_intervals:
+            return self._compute_weekend(date, day_str, attendance_intervals), abs_cnt
+        if day_input.holiday:
+            return self._compute_holiday(date, day_str, attendance_intervals), abs_cnt
+        return self._compute_workday(date, day_str, work_intervals, attendance_intervals,
+                                     leaves, leave_set, abs_cnt)
+
+    def _compute_holiday(self, date, day_str, attendance_intervals):
+        overtime_policy = self.overtime
+        if not attendance_intervals:
+            return [{
+                'date': date,
+                'day': day_str,
+                'status': 'ph',
+            }]
+        lines = []
+        for attendance_interval in attendance_intervals:
+            overtime = attendance_interval[1] - attendance_interval[0]
+            float_overtime = overtime.total_seconds() / 3600
+            if float_overtime <= overtime_policy['ph_after']:
+                float_overtime = 0
+            else:
+                float_overtime = (float_overtime - overtime_policy['ph_after']) * overtime_policy['ph_rate']
+            float_ac_sign_in = self._to_float(attendance_interval[0])
+            float_worked_hours = overtime.total_seconds() / 3600
+            lines.append({
+                'date': date,
+                'day': day_str,
+                'ac_sign_in': float_ac_sign_in,
+                'ac_sign_out': float_ac_sign_in + float_worked_hours,
+                'worked_hours': float_worked_hours,
+                'o_worked_hours': float_worked_hours,
+                'overtime': float_overtime,
+                'act_overtime': float_overtime,
+                'status': 'ph',
+                'note': self.notes['ph'],
+            })
+        return lines
+
+    def _compute_weekend(self, date, day_str, attendance_intervals):
+        overtime_policy = self.overtime
+        if not attendance_intervals:
+            return [{
+                'date': date,
+                'day': day_str,
+                'status': 'weekend',
+                'note': "",
+            }]
+        lines = []
+        for attendance_interval in attendance_intervals:
+            overtime = attendance_interval[1] - attendance_interval[0]
+            float_overtime = overtime.total_seconds() / 3600
+            if float_overtime <= overtime_policy['we_after']:
+                float_overtime = 0
+            else:
+                float_overtime = float_overtime * overtime_policy['we_rate']
+            lines.append({
+                'date': date,
+                'day': day_str,
+                'ac_sign_in': self._to_float(attendance_interval[0]),
+                'ac_sign_out': self._to_float(attendance_interval[1]),
+                'overtime': float_overtime,
+                'act_overtime': float_overtime,
+                'worked_hours': overtime.total_seconds() / 3600,
+                'status': 'weekend',
+                'note': self.notes['weekend'],
+            })
+        return lines
+
+    @staticmethod
+    def _match_punches(work_intervals, attendance_intervals):
+        """ Assign the punches of a day to its work intervals, splitting the
+        punches spanning several of them at the start of the next one.
+
+        :return: (list of the punch pieces of each work interval, list of the
+            pieces out of every work interval)
+        """
+        well_formed = all(start < stop for start, stop in work_intervals) and \
+            all(work_intervals[k][1] < work_intervals[k + 1][0] for k in range(len(work_intervals) - 1)) and \
+            all(start < stop for start, stop in attendance_intervals) and \
+            all(attendance_intervals[j][0] <= attendance_intervals[j + 1][0]
+                for j in range(len(attendance_intervals) - 1))
+        if not well_formed:
+            return AttendanceEngine._match_punches_scan(work_intervals, attendance_intervals)
+        # sorted disjoint work intervals and sorted punches: one sweep, the
+        # first work interval ending after a punch start only moves forward
+        matched = [[] for work_interval in work_intervals]
+        pieces = []
+        reserved = set()
+        count = len(work_intervals)
+        first = 0
+        for start, stop in attendance_intervals:
+            while first < count and work_intervals[first][1] <= start:
+                first += 1
+            k = first
+            current = (start, stop)
+            while k < count and work_intervals[k][0] < current[1]:
+                if k + 1 < count and work_intervals[k + 1][0] < current[1]:
+                    split = work_intervals[k + 1][0]
+                    matched[k].append((current[0], split))
+                    reserved.add((current[0], split))
+                    pieces.append((current[0], split))
+                    current = (split, current[1])
+                    k += 1
+                    continue
+                matched[k].append(current)
+                reserved.add(current)
+                break
+            pieces.append(current)
+        return matched, [piece for piece in pieces if piece not in reserved]
+
+    @staticmethod
+    def _match_punches_scan(work_intervals, attendance_intervals):
+        """ Same as _match_punches, comparing every punch to every work
+        interval, for days whose intervals are not sorted or empty. """
+        attendance_intervals = list(attendance_intervals)
+        matched = []
+        reserved_intervals = []
+        for i, work_interval in enumerate(work_intervals):
+            att_work_intervals = []
+            for j, att_interval in enumerate(attendance_intervals):
+                if max(work_interval[0], att_interval[0]) < min(work_interval[1], att_interval[1]):
+                    current_att_interval = att_interval
+                    if i + 1 < len(work_intervals):
+                        next_work_interval = work_intervals[i + 1]
+                        if max(next_work_interval[0], current_att_interval[0]) < min(
+                                next_work_interval[1], current_att_interval[1]):
+                            split_att_interval = (next_work_interval[0], current_att_interval[1])
+                            current_att_interval = (current_att_interval[0], next_work_interval[0])
+                            attendance_intervals[j] = current_att_interval
+                            attendance_intervals.insert(j + 1, split_att_interval)
+                    att_work_intervals.append(current_att_interval)
+            reserved_intervals += att_work_intervals
+            matched.append(att_work_intervals)
+        return matched, [x for x in attendance_intervals if x not in reserved_intervals]
+
+    def _compute_workday(self, date, day_str, work_intervals, attendance_intervals,
+                         leaves, leave_set, abs_cnt):
+        policy = self.policy
+        overtime_policy = self.overtime
+        lines = []
+        abs_flag = False
+        matched_intervals, out_intervals = self._match_punches(work_intervals, attendance_intervals)
+        for work_interval, att_work_intervals in zip(work_intervals, matched_intervals):
+            float_worked_hours = 0
+            diff_intervals = []
+            late_in_interval = []
+            diff_time = timedelta()
+            late_in = timedelta()
+            overtime = timedelta()
+            pl_sign_in = self._to_float(work_interval[0])
+            pl_sign_out = self._to_float(work_interval[1])
+            ac_sign_in = 0
+            ac_sign_out = 0
+            status = ""
+            if att_work_intervals:
+                late_in_interval = (work_interval[0], att_work_intervals[0][0])
+                overtime_interval = (work_interval[1], att_work_intervals[-1][1])
+                if len(att_work_intervals) > 1:
+                    if overtime_interval[1] < overtime_interval[0]:
+                        overtime = timedelta()
+                    else:
+                        overtime = overtime_interval[1] - overtime_interval[0]
+                    remain_interval = (att_work_intervals[0][1], work_interval[1])
+                    for att_work_interval in att_work_intervals:
+                        float_worked_hours += (att_work_interval[1] - att_work_interval[0]).total_seconds() / 3600
+                        if att_work_interval[1] <= remain_interval[0]:
+                            continue
+                        if att_work_interval[0] >= remain_interval[1]:
+                            break
+                        if remain_interval[0] < att_work_interval[0] < remain_interval[1]:
+                            diff_intervals.append((remain_interval[0], att_work_interval[0]))
+                            remain_interval = (att_work_interval[1], remain_interval[1])
+                    if remain_interval and remain_interval[0] <= work_interval[1]:
+                        diff_intervals.append((remain_interval[0], work_interval[1]))
+                    ac_sign_in = self._to_float(att_work_intervals[0][0])
+                    ac_sign_out = ac_sign_in + ((att_work_intervals[-1][1] -
+                                                 att_work_intervals[0][0]).total_seconds() / 3600)
+                else:
+                    if overtime_interval[1] < overtime_interval[0]:
+                        overtime = timedelta()
+                        diff_intervals.append((overtime_interval[1], overtime_interval[0]))
+                    else:
+                        overtime = overtime_interval[1] - overtime_interval[0]
+                    ac_sign_in = self._to_float(att_work_intervals[0][0])
+                    worked_hours = att_work_intervals[0][1] - att_work_intervals[0][0]
+                    float_worked_hours = worked_hours.total_seconds() / 3600
+                    ac_sign_out = ac_sign_in + float_worked_hours
+            else:
+                late_in_interval = []
+                diff_intervals.append((work_interval[0], work_interval[1]))
+                status = "ab"
+            for diff_in in diff_intervals:
+                if leaves:
+                    status = "leave"
+                    for diff_clean in leave_set.subtract_interval(diff_in):
+                        diff_time += diff_clean[1] - diff_clean[0]
+                else:
+                    diff_time += diff_in[1] - diff_in[0]
+            if late_in_interval and late_in_interval[1] >= late_in_interval[0]:
+                if leaves:
+                    for late_clean in leave_set.subtract_interval(late_in_interval):
+                        late_in += late_clean[1] - late_clean[0]
+                else:
+                    late_in = late_in_interval[1] - late_in_interval[0]
+            float_overtime = overtime.total_seconds() / 3600
+            if float_overtime <= overtime_policy['wd_after']:
+                act_float_overtime = float_overtime = 0
+            else:
+                float_overtime = float_overtime * overtime_policy['wd_rate']
+                act_float_overtime = (float_overtime - overtime_policy['wd_after'])
+                float_overtime = float_overtime * overtime_policy['wd_rate']
+            act_float_late = late_in.total_seconds() / 3600
+            float_diff = diff_time.total_seconds() / 3600
+            if status == 'ab':
+                if not abs_flag:
+                    abs_cnt += 1
+                abs_flag = True
+                act_float_diff = float_diff
+                float_diff = policy.get_absence(float_diff, abs_cnt)
+            else:
+                act_float_diff = float_diff
+                float_diff = policy.get_diff(float_diff)
+            lines.append({
+                'date': date,
+                'day': day_str,
+                'pl_sign_in': pl_sign_in,
+                'pl_sign_out': pl_sign_out,
+                'ac_sign_in': ac_sign_in,
+                'ac_sign_out': ac_sign_out,
+                'late_in': policy.get_late(act_float_late),
+                'act_late_in': act_float_late,
+                'overtime': float_overtime,
+                'act_overtime': act_float_overtime,
+                'diff_time': float_diff,
+                'act_diff_time': act_float_diff,
+                'status': status,
+            })
+        for att_out in out_intervals:
+            overtime = att_out[1] - att_out[0]
+            ac_sign_in = self._to_float(att_out[0])
+            float_worked_hours = overtime.total_seconds() / 3600
+            float_overtime = overtime.total_seconds() / 3600
+            if float_overtime <= overtime_policy['wd_after']:
+                float_overtime = act_float_overtime = 0
+            else:
+                act_float_overtime = (float_overtime - overtime_policy['ph_after'])
+                float_overtime = float_overtime * overtime_policy['wd_rate']
+            lines.append({
+                'date': date,
+                'day': day_str,
+                'pl_sign_in': 0,
+                'pl_sign_out': 0,
+                'ac_sign_in': ac_sign_in,
+                'ac_sign_out': ac_sign_in + float_worked_hours,
+                'overtime': float_overtime,
+                'worked_hours': float_worked_hours,
+                'act_overtime': act_float_overtime,
+                'note': self.notes['out'],
+            })
+        return lines, abs_cnt
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+import math
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """ Distance in meters between two points given in degrees. """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def point_in_polygon(lat, lng, polygon):
+    """ Ray casting test of a point against a polygon of (lat, lng). """
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat) and \
+                lng < (lng_j - lng_i) * (lat - lat_i) / (lat_j - lat_i) + lng_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+class GeoFence(object):
+    """ A work site geofence: a circle around a center or a polygon. """
+    __slots__ = ('site_id', 'lat', 'lng', 'radius', 'polygon', 'bbox')
+
+    def __init__(self, site_id, lat=0.0, lng=0.0, radius=0.0, polygon=None):
+        self.site_id = site_id
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+        self.polygon = tuple(polygon) if polygon else None
+        if self.polygon:
+            lats = [point[0] for point in self.polygon]
+            lngs = [point[1] for point in self.polygon]
+            self.bbox = (min(lats), min(lngs), max(lats), max(lngs))
+        else:
+            d_lat = radius / METERS_PER_DEGREE
+            d_lng = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+            self.bbox = (lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng)
+
+    def contains(self, lat, lng):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        if self.polygon:
+            return point_in_polygon(lat, lng, self.polygon)
+        return haversine(self.lat, self.lng, lat, lng) <= self.radius
+
+
+class GeoFenceIndex(object):
+    """ Grid bucket index of geofences: every fence is registered in the
+    cells its bounding box covers, so that a lookup only tests the few fences
+    of the cell holding the point.
+    """
+    __slots__ = ('cell_size', 'cells')
+
+    def __init__(self, fences, cell_size=0.01):
+        self.cell_size = cell_size
+        self.cells = {}
+        for fence in fences:
+            min_lat, min_lng, max_lat, max_lng = fence.bbox
+            for i in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for j in range(self._cell(min_lng), self._cell(max_lng) + 1):
+                    self.cells.setdefault((i, j), []).append(fence)
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_size))
+
+    def locate(self, lat, lng):
+        """ Return the id of the first fence holding the point, or None. """
+        for fence in self.cells.get((self._cell(lat), self._cell(lng)), ()):
+            if fence.contains(lat, lng):
+                return fence.site_id
+        return None
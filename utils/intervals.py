@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from operator import itemgetter
+
+
+def merge_intervals(intervals):
+    """ Sort ``intervals`` and merge the overlapping or touching ones. """
+    merged = []
+    for start, stop in sorted(intervals, key=itemgetter(0)):
+        if merged and start <= merged[-1][1]:
+            if stop > merged[-1][1]:
+                merged[-1][1] = stop
+        else:
+            merged.append([start, stop])
+    return [tuple(interval) for interval in merged]
+
+
+def touches_intervals(starts, stops, start, stop):
+    """ Whether one of the merged intervals given by their sorted ``starts``
+    and ``stops`` touches [start, stop].
+    """
+    i = bisect_left(stops, start)
+    return i < len(stops) and starts[i] <= stop
+
+
+def subtract_intervals(starts, stops, interval):
+    """ Return the parts of ``interval`` not covered by the merged intervals
+    given by their sorted ``starts`` and ``stops``.
+    """
+    start, stop = interval
+    res = []
+    current = start
+    i = bisect_right(stops, start)
+    while i < len(stops) and starts[i] < stop:
+        if starts[i] > current:
+            res.append((current, starts[i]))
+        current = max(current, stops[i])
+        i += 1
+    if current < stop:
+        res.append((current, stop))
+    return res
+
+
+class IntervalSet(object):
+    """ Immutable sorted set of disjoint (start, stop) intervals.
+
+    The intervals given to the constructor are merged like
+    ``merge_intervals`` does, touching intervals included, and are expected
+    to have their start before their stop. Union, intersection and difference
+    walk both sets once, in linear time, and queries on a single interval use
+    a bisect lookup.
+    """
+    __slots__ = ('_starts', '_stops')
+
+    def __init__(self, intervals=()):
+        merged = merge_intervals(intervals)
+        set_attr = super(IntervalSet, self).__setattr__
+        set_attr('_starts', tuple(interval[0] for interval in merged))
+        set_attr('_stops', tuple(interval[1] for interval in merged))
+
+    @classmethod
+    def _from_merged(cls, merged):
+        res = cls.__new__(cls)
+        set_attr = super(IntervalSet, res).__setattr__
+        set_attr('_starts', tuple(interval[0] for interval in merged))
+        set_attr('_stops', tuple(interval[1] for interval in merged))
+        return res
+
+    def __setattr__(self, name, value):
+        raise AttributeError("IntervalSet is immutable")
+
+    def __iter__(self):
+        return zip(self._starts, self._stops)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __bool__(self):
+        return bool(self._starts)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and \
+            self._starts == other._starts and self._stops == other._stops
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._starts, self._stops))
+
+    def __repr__(self):
+        return 'IntervalSet(%r)' % list(self)
+
+    def union(self, other):
+        """ Return the intervals covered by ``self`` or ``other``. """
+        merged = []
+        left, right = list(self), list(other)
+        i = j = 0
+        while i < len(left) or j < len(right):
+            if j == len(right) or (i < len(left) and left[i][0] <= right[j][0]):
+                start, stop = left[i]
+                i += 1
+            else:
+                start, stop = right[j]
+                j += 1
+            if merged and start <= merged[-1][1]:
+                if stop > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], stop)
+            else:
+                merged.append((start, stop))
+        return IntervalSet._from_merged(merged)
+
+    def intersection(self, other):
+        """ Return the non empty intervals covered by both sets. """
+        res = []
+        i = j = 0
+        while i < len(self._starts) and j < len(other._starts):
+            start = max(self._starts[i], other._starts[j])
+            stop = min(self._stops[i], other._stops[j])
+            if start < stop:
+                res.append((start, stop))
+            if self._stops[i] < other._stops[j]:
+                i += 1
+            else:
+                j += 1
+        return IntervalSet(res)
+
+    def difference(self, other):
+        """ Return the non empty parts of ``self`` not covered by ``other``. """
+        res = []
+        j = 0
+        for start, stop in self:
+            while j < len(other._stops) and other._stops[j] <= start:
+                j += 1
+            current = start
+            k = j
+            while k < len(other._starts) and other._starts[k] < stop:
+                if other._starts[k] > current:
+                    res.append((current, other._starts[k]))
+                current = max(current, other._stops[k])
+                k += 1
+            if current < stop:
+                res.append((current, stop))
+        return IntervalSet(res)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def duration(self, zero=timedelta()):
+        """ Return the total length of the intervals, starting from ``zero``. """
+        total = zero
+        for start, stop in self:
+            total += stop - start
+        return total
+
+    def touches(self, start, stop):
+        """ Whether one of the intervals touches [start, stop]. """
+        return touches_intervals(self._starts, self._stops, start, stop)
+
+    def subtract_interval(self, interval):
+        """ Return the parts of ``interval`` not covered by the set, as a
+        list of (start, stop) tuples. """
+        return subtract_intervals(self._starts, self._stops, interval)
+
+
+EMPTY_SET = IntervalSet()
+
+
+class LeaveIndex(object):
+    """ Merged and sorted leave intervals per employee.
+
+    Built once for a period, it answers overlap and subtraction queries with
+    a bisect lookup instead of rescanning the employee's leaves.
+    """
+    __slots__ = ('_sets',)
+
+    def __init__(self, leaves):
+        """ :param leaves: iterable of (employee_id, date_from, date_to) """
+        by_employee = {}
+        for emp_id, date_from, date_to in leaves:
+            by_employee.setdefault(emp_id, []).append((date_from, date_to))
+        self._sets = {emp_id: IntervalSet(intervals) for emp_id, intervals in by_employee.items()}
+
+    def get_leave_set(self, emp_id):
+        """ Return the leaves of the employee as an IntervalSet. """
+        return self._sets.get(emp_id) or EMPTY_SET
+
+    def get_leaves(self, emp_id):
+        """ Return the merged and sorted leaves of the employee. """
+        return list(self.get_leave_set(emp_id))
+
+    def has_leave(self, emp_id, start, stop):
+        """ Whether a leave of the employee touches [start, stop]. """
+        return self.get_leave_set(emp_id).touches(start, stop)
+
+    def subtract(self, emp_id, interval):
+        """ Return the parts of ``interval`` not covered by the employee's
+        leaves, as a list of (start, stop) tuples.
+        """
+        return self.get_leave_set(emp_id).subtract_interval(interval)
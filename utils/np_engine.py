@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+from collections import namedtuple
+from datetime import datetime, time
+
+import pytz
+
+from .engine import DEFAULT_NOTES, AttendanceEngine
+from .intervals import IntervalSet
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the inputs of one sheet: a PolicyEvaluator, a pytz timezone, a list of
+# engine.DayInput and the merged (start, stop) leaves of the employee
+SheetInput = namedtuple('SheetInput', ['policy', 'tz', 'days', 'leaves'])
+
+
+def _to_epoch(values):
+    """ Convert naive UTC datetimes to int64 epoch seconds. """
+    return np.array(values, dtype='datetime64[s]').astype(np.int64)
+
+
+def _utc_offsets(tz, epochs):
+    """ Return the UTC offset in seconds of ``tz`` at each of ``epochs``,
+    using the transition table of the timezone like ``tz.fromutc``.
+    """
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        offset = tz.utcoffset(datetime(2000, 1, 1))
+        return np.full(len(epochs), int(offset.total_seconds()), dtype=np.int64)
+    times = _to_epoch(transitions)
+    offsets = np.array([int(info[0].total_seconds()) for info in tz._transition_info], dtype=np.int64)
+    idx = np.maximum(np.searchsorted(times, epochs, side='right') - 1, 0)
+    return offsets[idx]
+
+
+def _local_floats(epochs, offsets):
+    """ Same as engine.float_from_time on the local times of ``epochs``. """
+    seconds = (epochs + offsets) % 86400
+    return (seconds // 3600) + ((seconds % 3600) // 60) / 60.0
+
+
+def _is_vectorizable(day_input):
+    """ Whether the work intervals of a day are proper, sorted and
+    disjoint and its punches sorted on their start, so that the matching
+    of the vectorized engine gives the lines of engine.AttendanceEngine.
+    Zero length punches are allowed: they never overlap a work interval.
+    """
+    work_intervals = day_input.work_intervals
+    punches = day_input.punches
+    return all(start < stop for start, stop in work_intervals) and \
+        all(work_intervals[k][1] < work_intervals[k + 1][0] for k in range(len(work_intervals) - 1)) and \
+        all(start <= stop for start, stop in punches) and \
+        all(punches[j][0] <= punches[j + 1][0] for j in range(len(punches) - 1))
+
+
+class VectorizedAttendanceEngine(object):
+    """ NumPy implementation of engine.AttendanceEngine for many sheets.
+
+    Work intervals, punches and leaves of all the sheets are packed into
+    int64 epoch second arrays; the assignment of punches to work intervals,
+    their splitting, the late in, overtime and difference time of every work
+    interval, the leave coverage and the local time conversions are computed
+    with vectorized operations. Only the building of the line values and the
+    policy evaluation, which is sequential through the absence counter,
+    remain in Python. The working days with improper or unsorted intervals
+    are computed by engine.AttendanceEngine. Datetimes are expected to have
+    no microseconds, as stored by the ORM.
+    """
+    __slots__ = ('notes',)
+
+    def __init__(self, notes=None):
+        if np is None:
+            raise ImportError("The vectorized attendance engine requires numpy")
+        self.notes = dict(DEFAULT_NOTES, **(notes or {}))
+
+    def compute_sheets(self, sheets):
+        """ Compute the lines of ``sheets``, a list of SheetInput.
+
+        :return: list of lists of line values, one per sheet
+        """
+        # flatten the inputs; every (sheet, day) is a group
+        w_group, w_bounds, p_group, p_bounds, days = [], [], [], [], []
+        leave_sets = []
+        scalar_days = {}
+        for s, sheet in enumerate(sheets):
+            leave_set = IntervalSet(sheet.leaves)
+            leave_sets.append(leave_set)
+            for day_input in sheet.days:
+                g = len(days)
+                day_start = datetime.combine(day_input.date, time.min)
+                day_end = day_start.replace(hour=23, minute=59, second=59)
+                has_leave = leave_set.touches(
+                    sheet.tz.localize(day_start).astimezone(pytz.utc).replace(tzinfo=None),
+                    sheet.tz.localize(day_end).astimezone(pytz.utc).replace(tzinfo=None))
+                if not day_input.work_intervals:
+                    kind = 'weekend'
+                elif day_input.holiday:
+                    kind = 'ph'
+                elif not _is_vectorizable(day_input):
+                    kind = 'scalar'
+                    scalar_days[g] = day_input
+                    days.append((s, day_input.date, kind, has_leave, len(p_group), len(p_group)))
+                    continue
+                else:
+                    kind = 'work'
+                    w_group += [g] * len(day_input.work_intervals)
+                    w_bounds += day_input.work_intervals
+                p_first = len(p_group)
+                p_group += [g] * len(day_input.punches)
+                p_bounds += day_input.punches
+                days.append((s, day_input.date, kind, has_leave, p_first, len(p_group)))
+        if not days:
+            return [[] for sheet in sheets]
+
+        w_group = np.array(w_group, dtype=np.int64)
+        p_group = np.array(p_group, dtype=np.int64)
+        w_start = _to_epoch([b[0] for b in w_bounds]).reshape(-1)
+        w_end = _to_epoch([b[1] for b in w_bounds]).reshape(-1)
+        p_start = _to_epoch([b[0] for b in p_bounds]).reshape(-1)
+        p_end = _to_epoch([b[1] for b in p_bounds]).reshape(-1)
+        day_sheet = np.array([day[0] for day in days], dtype=np.int64)
+        day_is_work = np.array([day[2] == 'work' for day in days], dtype=bool)
+        day_has_leave = np.array([day[3] for day in days], dtype=bool)
+        n_w = len(w_group)
+
+        # local time floats, computed per timezone
+        w_start_f = np.zeros(n_w)
+        w_end_f = np.zeros(n_w)
+        p_start_f = np.zeros(len(p_group))
+        p_end_f = np.zeros(len(p_group))
+        tz_sheets = {}
+        for s, sheet in enumerate(sheets):
+            tz_sheets.setdefault(sheet.tz, []).append(s)
+        for tz, sheet_ids in tz_sheets.items():
+            w_mask = np.isin(day_sheet[w_group], sheet_ids)
+            p_mask = np.isin(day_sheet[p_group], sheet_ids)
+            for mask, epochs, res in ((w_mask, w_start, w_start_f), (w_mask, w_end, w_end_f),
+                                      (p_mask, p_start, p_start_f), (p_mask, p_end, p_end_f)):
+                if mask.any():
+                    res[mask] = _local_floats(epochs[mask], _utc_offsets(tz, epochs[mask]))
+
+        # group keyed times, so that searches never cross a (sheet, day)
+        all_times = [a for a in (w_start, w_end, p_start, p_end) if len(a)]
+        t0 = min(int(a.min()) for a in all_times) if all_times else 0
+        t1 = max(int(a.max()) for a in all_times) if all_times else 0
+        span = t1 - t0 + 1
+        w_key_start = w_group * span + (w_start - t0)
+        w_key_end = w_group * span + (w_end - t0)
+
+        # assign punches of working days to the work intervals they overlap;
+        # zero length punches overlap none of them
+        p_kind_work = day_is_work[p_group] & (p_end > p_start)
+        p_key_start = p_group * span + (p_start - t0)
+        p_key_end = p_group * span + (p_end - t0)
+        lo = np.searchsorted(w_key_end, p_key_start, side='right')
+        hi = np.searchsorted(w_key_start, p_key_end, side='left')
+        n_pieces = np.where(p_kind_work, np.maximum(hi - lo, 0), 0)
+
+        # a punch overlapping consecutive work intervals is split at the
+        # start of each of them but the first
+        piece_punch = np.repeat(np.arange(len(p_group)), n_pieces)
+        piece_rank = np.arange(len(piece_punch)) - np.repeat(np.cumsum(n_pieces) - n_pieces, n_pieces)
+        piece_w = lo[piece_punch] + piece_rank
+        next_w = np.minimum(piece_w + 1, max(n_w - 1, 0))
+        piece_start = np.where(piece_rank == 0, p_start[piece_punch], w_start[piece_w])
+        piece_end = np.where(piece_rank == n_pieces[piece_punch] - 1, p_end[piece_punch], w_start[next_w])
+        piece_start_f = np.where(piece_rank == 0, p_start_f[piece_punch], w_start_f[piece_w])
+
+        order = np.argsort(piece_w, kind='stable')
+        piece_w = piece_w[order]
+        piece_start = piece_start[order]
+        piece_end = piece_end[order]
+        piece_start_f = piece_start_f[order]
+        w_count = np.bincount(piece_w, minlength=n_w) if n_w else np.zeros(0, dtype=np.int64)
+        w_first = np.cumsum(w_count) - w_count
+        has_piece = w_count > 0
+        first_idx = np.where(has_piece, w_first, 0)
+        last_idx = np.where(has_piece, w_first + w_count - 1, 0)
+        if len(piece_w):
+            first_start = np.where(has_piece, piece_start[first_idx], 0)
+            last_end = np.where(has_piece, piece_end[last_idx], 0)
+            first_start_f = np.where(has_piece, piece_start_f[first_idx], 0.0)
+        else:
+            first_start = last_end = np.zeros(n_w, dtype=np.int64)
+            first_start_f = np.zeros(n_w)
+
+        late_start = w_start
+        late_end = np.where(has_piece & (first_start >= w_start), first_start, w_start)
+        overtime = np.where(has_piece, np.maximum(last_end - w_end, 0), 0)
+
+        # difference time intervals, as (work interval, start, stop)
+        diff_w, diff_start, diff_end = [], [], []
+        absent = np.flatnonzero(~has_piece)
+        single = np.flatnonzero((w_count == 1) & (last_end < w_end))
+        diff_w += absent.tolist() + single.tolist()
+        diff_start += w_start[absent].tolist() + last_end[single].tolist()
+        diff_end += w_end[absent].tolist() + w_end[single].tolist()
+        piece_start_l = piece_start.tolist()
+        piece_end_l = piece_end.tolist()
+        w_end_l = w_end.tolist()
+        for w in np.flatnonzero(w_count > 1).tolist():
+            first = int(w_first[w])
+            remain = (piece_end_l[first], w_end_l[w])
+            for i in range(first, first + int(w_count[w])):
+                if piece_end_l[i] <= remain[0]:
+                    continue
+                if piece_start_l[i] >= remain[1]:
+                    break
+                if remain[0] < piece_start_l[i] < remain[1]:
+                    diff_w.append(w)
+                    diff_start.append(remain[0])
+                    diff_end.append(piece_start_l[i])
+                    remain = (piece_end_l[i], remain[1])
+            if remain[0] <= w_end_l[w]:
+                diff_w.append(w)
+                diff_start.append(remain[0])
+                diff_end.append(w_end_l[w])
+        diff_w = np.array(diff_w, dtype=np.int64)
+        diff_start = np.array(diff_start, dtype=np.int64)
+        diff_end = np.array(diff_end, dtype=np.int64)
+        has_diff = np.bincount(diff_w, minlength=n_w) > 0 if n_w else np.zeros(0, dtype=bool)
+
+        # leave coverage, subtracted on the days touched by a leave
+        w_has_leave = day_has_leave[w_group]
+        coverage = self._leave_coverage(sheets, t0, span)
+        diff_len = diff_end - diff_start
+        late_len = late_end - late_start
+        if coverage is not None:
+            diff_sheet = day_sheet[w_group[diff_w]]
+            w_sheet = day_sheet[w_group]
+            diff_len = np.where(w_has_leave[diff_w], diff_len - (
+                coverage(diff_sheet, diff_end) - coverage(diff_sheet, diff_start)), diff_len)
+            late_len = np.where(w_has_leave, late_len - (
+                coverage(w_sheet, late_end) - coverage(w_sheet, late_start)), late_len)
+        diff_secs = np.zeros(n_w, dtype=np.int64)
+        np.add.at(diff_secs, diff_w, diff_len)
+
+        # plain python values for the assembly
+        w_values = list(zip(
+            w_start_f.tolist(), w_end_f.tolist(), w_count.tolist(), first_start_f.tolist(),
+            ((last_end - first_start) / 3600).tolist(), (late_len / 3600).tolist(),
+            (overtime / 3600).tolist(), (diff_secs / 3600).tolist(), has_diff.tolist()))
+        p_values = list(zip(p_start_f.tolist(), p_end_f.tolist(),
+                            ((p_end - p_start) / 3600).tolist(), (n_pieces == 0).tolist()))
+        w_by_group = np.searchsorted(w_group, np.arange(len(days) + 1)).tolist()
+        return self._assemble(sheets, days, w_values, p_values, w_by_group, leave_sets, scalar_days)
+
+    def _leave_coverage(self, sheets, t0, span):
+        """ Return a function giving, for sheet indexes and epochs, the leave
+        seconds of the sheet employee before each epoch, or None without
+        leaves.
+        """
+        l_sheet, l_bounds = [], []
+        for s, sheet in enumerate(sheets):
+            l_sheet += [s] * len(sheet.leaves)
+            l_bounds += sheet.leaves
+        if not l_bounds:
+            return None
+        l_sheet = np.array(l_sheet, dtype=np.int64)
+        l_start = np.clip(_to_epoch([b[0] for b in l_bounds]).reshape(-1), t0, t0 + span - 1)
+        l_end = np.clip(_to_epoch([b[1] for b in l_bounds]).reshape(-1), t0, t0 + span - 1)
+        key_start = l_sheet * span + (l_start - t0)
+        key_end = l_sheet * span + (l_end - t0)
+        lengths = l_end - l_start
+        before = np.concatenate(([0], np.cumsum(lengths)))
+        sheet_before = before[np.searchsorted(l_sheet, np.arange(len(sheets)))]
+
+        def coverage(sheet_ids, epochs):
+            keys = sheet_ids * span + (epochs - t0)
+            # leaves ending before the key, plus the part of the one holding it
+            idx = np.searchsorted(key_end, keys, side='right')
+            covered = before[idx] - sheet_before[sheet_ids]
+            inside = np.minimum(idx, len(key_start) - 1)
+            partial = (idx < len(key_start)) & (key_start[inside] < keys) & (l_sheet[inside] == sheet_ids)
+            return covered + np.where(partial, keys - key_start[inside], 0)
+        return coverage
+
+    def _assemble(self, sheets, days, w_values, p_values, w_by_group, leave_sets, scalar_days):
+        res = [[] for sheet in sheets]
+        abs_counts = [0] * len(sheets)
+        scalar_engines = {}
+        for g, (s, day, kind, has_leave, p_first, p_last) in enumerate(days):
+            policy = sheets[s].policy
+            overtime_policy = policy.get_overtime()
+            lines = res[s]
+            if kind == 'scalar':
+                if s not in scalar_engines:
+                    scalar_engines[s] = AttendanceEngine(policy, sheets[s].tz, self.notes)
+                day_lines, abs_counts[s] = scalar_engines[s].compute_day(
+                    scalar_days[g], leave_sets[s], abs_counts[s])
+                lines += day_lines
+                continue
+            day_str = str(day.weekday())
+            date = day.strftime('%Y-%m-%d')
+            punches = p_values[p_first:p_last]
+            if kind == 'weekend':
+                if not punches:
+                    lines.append({'date': date, 'day': day_str, 'status': 'weekend', 'note': ""})
+                for start_f, end_f, hours, unassigned in punches:
+                    float_overtime = hours
+                    if float_overtime <= overtime_policy['we_after']:
+                        float_overtime = 0
+                    else:
+                        float_overtime = float_overtime * overtime_policy['we_rate']
+                    lines.append({
+                        'date': date,
+                        'day': day_str,
+                        'ac_sign_in': start_f,
+                        'ac_sign_out': end_f,
+                        'overtime': float_overtime,
+                        'act_overtime': float_overtime,
+                        'worked_hours': hours,
+                        'status': 'weekend',
+                        'note': self.notes['weekend'],
+                    })
+                continue
+            if kind == 'ph':
+                if not punches:
+                    lines.append({'date': date, 'day': day_str, 'status': 'ph'})
+                for start_f, end_f, hours, unassigned in punches:
+                    float_overtime = hours
+                    if float_overtime <= overtime_policy['ph_after']:
+                        float_overtime = 0
+                    else:
+                        float_overtime = (float_overtime - overtime_policy['ph_after']) * overtime_policy['ph_rate']
+                    lines.append({
+                        'date': date,
+                        'day': day_str,
+                        'ac_sign_in': start_f,
+                        'ac_sign_out': start_f + hours,
+                        'worked_hours': hours,
+                        'o_worked_hours': hours,
+                        'overtime': float_overtime,
+                        'act_overtime': float_overtime,
+                        'status': 'ph',
+                        'note': self.notes['ph'],
+                    })
+                continue
+            abs_flag = False
+            for w in range(w_by_group[g], w_by_group[g + 1]):
+                (pl_sign_in, pl_sign_out, count, ac_sign_in, span_hours, float_late,
+                 float_overtime, float_diff, has_diff) = w_values[w]
+                ac_sign_out = ac_sign_in + span_hours if count else 0
+                status = "" if count else "ab"
+                if has_leave and has_diff:
+                    status = "leave"
+                if float_overtime <= overtime_policy['wd_after']:
+                    act_float_overtime = float_overtime = 0
+                else:
+                    float_overtime = float_overtime * overtime_policy['wd_rate']
+                    act_float_overtime = (float_overtime - overtime_policy['wd_after'])
+                    float_overtime = float_overtime * overtime_policy['wd_rate']
+                act_float_diff = float_diff
+                if status == 'ab':
+                    if not abs_flag:
+                        abs_counts[s] += 1
+                    abs_flag = True
+                    float_diff = policy.get_absence(float_diff, abs_counts[s])
+                else:
+                    float_diff = policy.get_diff(float_diff)
+                lines.append({
+                    'date': date,
+                    'day': day_str,
+                    'pl_sign_in': pl_sign_in,
+                    'pl_sign_out': pl_sign_out,
+                    'ac_sign_in': ac_sign_in if count else 0,
+                    'ac_sign_out': ac_sign_out,
+                    'late_in': policy.get_late(float_late),
+                    'act_late_in': float_late,
+                    'overtime': float_overtime,
+                    'act_overtime': act_float_overtime,
+                    'diff_time': float_diff,
+                    'act_diff_time': act_float_diff,
+                    'status': status,
+                })
+            for start_f, end_f, hours, unassigned in punches:
+                if not unassigned:
+                    continue
+                float_overtime = hours
+                if float_overtime <= overtime_policy['wd_after']:
+                    float_overtime = act_float_overtime = 0
+                else:
+                    act_float_overtime = (float_overtime - overtime_policy['ph_after'])
+                    float_overtime = float_overtime * overtime_policy['wd_rate']
+                lines.append({
+                    'date': date,
+                    'day': day_str,
+                    'pl_sign_in': 0,
+                    'pl_sign_out': 0,
+                    'ac_sign_in': start_f,
+                    'ac_sign_out': start_f + hours,
+                    'overtime': float_overtime,
+                    'worked_hours': hours,
+                    'act_overtime': act_float_overtime,
+                    'note': self.notes['out'],
+                })
+        return res
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+from bisect import bisect_right
+
+OVERTIME_TYPES = ('wd', 'we', 'ph')
+
+
+def _compile_thresholds(lines):
+    """ Sort ``(threshold, value)`` pairs on their threshold, keeping the
+    first value given for a repeated threshold.
+    """
+    by_threshold = {}
+    for threshold, value in lines:
+        by_threshold.setdefault(threshold, value)
+    thresholds = tuple(sorted(by_threshold))
+    return thresholds, tuple(by_threshold[t] for t in thresholds)
+
+
+class PolicyEvaluator(object):
+    """ Immutable, query free evaluation of an attendance policy.
+
+    :param overtime: {'wd_rate': .., 'wd_after': .., 'we_rate': .., ...}
+    :param late_lines: None when the policy has no late in rule, else an
+        iterable of (time, type, rate, amount)
+    :param diff_lines: same as ``late_lines`` for the difference time rule
+    :param absence_lines: None when the policy has no absence rule, else an
+        iterable of (counter, rate)
+    """
+    __slots__ = ('wd_rate', 'wd_after', 'we_rate', 'we_after', 'ph_rate',
+                 'ph_after', '_late', '_diff', '_absence')
+
+    def __init__(self, overtime, late_lines=None, diff_lines=None, absence_lines=None):
+        set_attr = super(PolicyEvaluator, self).__setattr__
+        for key in OVERTIME_TYPES:
+            set_attr(key + '_rate', overtime.get(key + '_rate', 1))
+            set_attr(key + '_after', overtime.get(key + '_after', 0))
+        if late_lines is not None:
+            late_lines = _compile_thresholds((line[0], line[1:]) for line in late_lines)
+        if diff_lines is not None:
+            diff_lines = _compile_thresholds((line[0], line[1:]) for line in diff_lines)
+        if absence_lines is not None:
+            absence_lines = _compile_thresholds(absence_lines)
+        set_attr('_late', late_lines)
+        set_attr('_diff', diff_lines)
+        set_attr('_absence', absence_lines)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PolicyEvaluator is immutable")
+
+    def get_overtime(self):
+        return {key + suffix: getattr(self, key + suffix)
+                for key in OVERTIME_TYPES for suffix in ('_rate', '_after')}
+
+    @staticmethod
+    def _apply_time_rule(rule, period):
+        if rule is None:
+            return period
+        thresholds, values = rule
+        i = bisect_right(thresholds, period) - 1
+        if i < 0:
+            return 0
+        line_type, rate, amount = values[i]
+        if line_type == 'rate':
+            return rate * period
+        elif line_type == 'fix':
+            return amount
+        return period
+
+    def get_late(self, period):
+        return self._apply_time_rule(self._late, period)
+
+    def get_diff(self, period):
+        return self._apply_time_rule(self._diff, period)
+
+    def get_absence(self, period, cnt):
+        if self._absence is None:
+            return period
+        counters, rates = self._absence
+        i = bisect_right(counters, cnt) - 1
+        if i < 0:
+            return 0
+        return rates[i] * period
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class PhaseStat(object):
+    """ Counters of one execution of a phase, the rows written (created or
+    updated) and the rows deleted being counted by the instrumented code
+    itself. """
+    __slots__ = ('rows', 'deleted')
+
+    def __init__(self):
+        self.rows = 0
+        self.deleted = 0
+
+
+class PhaseProfiler(object):
+    """ Accumulates the wall time, the number of SQL queries and the numbers
+    of rows written and deleted by named phases of a run.
+
+    Queries are counted with the ``sql_log_count`` of the cursor given to
+    every phase, so that phases executed by worker threads on their own
+    cursors are accounted for as well.
+    """
+
+    def __init__(self, cr):
+        self.cr = cr
+        self.phases = OrderedDict()
+        self.start = time.time()
+        self.start_queries = cr.sql_log_count
+        self.extra_queries = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name, cr):
+        stat = PhaseStat()
+        start = time.time()
+        start_queries = cr.sql_log_count
+        try:
+            yield stat
+        finally:
+            duration = time.time() - start
+            queries = cr.sql_log_count - start_queries
+            with self._lock:
+                phase = self.phases.setdefault(name, {
+                    'name': name, 'calls': 0, 'duration': 0.0, 'queries': 0, 'rows': 0, 'deleted': 0})
+                phase['calls'] += 1
+                phase['duration'] += duration
+                phase['queries'] += queries
+                phase['rows'] += stat.rows
+                phase['deleted'] += stat.deleted
+                if cr is not self.cr:
+                    self.extra_queries += queries
+
+    def get_summary(self):
+        """ Return the totals of the run and the list of its phases. """
+        with self._lock:
+            phases = [dict(phase) for phase in self.phases.values()]
+            return {
+                'duration': time.time() - self.start,
+                'queries': self.cr.sql_log_count - self.start_queries + self.extra_queries,
+                'rows': sum(phase['rows'] for phase in phases),
+                'deleted': sum(phase['deleted'] for phase in phases),
+                'phases': phases,
+            }
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+##############################################################################
+#
+#
+#    Copyright (C) 2020-TODAY .
+#    Author: Eng.Ramadan Khalil (<rkhalil1990@gmail.com>)
+#
+#    It is forbidden to publish, distribute, sublicense, or sell copies
+#    of the Software or modified copies of the Software.
+#
+##############################################################################
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+# offsets never exceed a day, so this margin keeps the local times of the
+# bounds of a period inside its table
+PERIOD_MARGIN = timedelta(days=1)
+
+
+class OffsetTable(object):
+    """ The UTC offsets of a pytz timezone over a period: the UTC times of
+    the transitions in force during the period and the offset starting at
+    each of them.
+
+    Converting a naive UTC datetime of the period to local time is then a
+    bisection and an addition, which gives the same result as
+    ``pytz.utc.localize(value).astimezone(tz)`` without building aware
+    datetimes.
+    """
+    __slots__ = ('tz', 'transitions', 'offsets')
+
+    def __init__(self, tz, start=None, stop=None):
+        self.tz = tz
+        times = getattr(tz, '_utc_transition_times', None)
+        if not times:
+            self.transitions = [datetime.min]
+            self.offsets = [tz.utcoffset(datetime(2000, 1, 1))]
+            return
+        lo = 0 if start is None else max(bisect_right(times, start - PERIOD_MARGIN) - 1, 0)
+        hi = len(times) if stop is None else max(bisect_right(times, stop + PERIOD_MARGIN), lo + 1)
+        self.transitions = times[lo:hi]
+        self.offsets = [info[0] for info in tz._transition_info[lo:hi]]
+
+    def offset(self, value):
+        """ Return the UTC offset of the timezone at the naive UTC ``value``. """
+        return self.offsets[max(bisect_right(self.transitions, value) - 1, 0)]
+
+    def to_local(self, value):
+        return value + self.offset(value)
+
+    def to_float(self, value):
+        """ Return the local hours of the naive UTC ``value`` as a float,
+        ignoring the seconds. """
+        local = value + self.offset(value)
+        return local.hour + local.minute / 60.0